@@ -1,4 +1,6 @@
 import os
+import re
+import json
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -17,15 +19,121 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 
 # Google Sheets Configuration
 SPREADSHEET_URL = os.getenv("SPREADSHEET_URL")
+_spreadsheet_id_match = re.search(r"/d/([a-zA-Z0-9-_]+)", SPREADSHEET_URL or "")
+SPREADSHEET_ID = os.getenv("SPREADSHEET_ID") or (
+    _spreadsheet_id_match.group(1) if _spreadsheet_id_match else None
+)
+SHEET_NAME = os.getenv("SHEET_NAME", "Sheet1")
+CREDENTIALS_FILE = os.getenv("CREDENTIALS_FILE", "credentials.json")
 
 # APIFlash Configuration
 APIFLASH_KEY = os.getenv("APIFLASH_KEY")
-APIFLASH_URL = "https://api.apiflash.com/v1/urltoimage"
+APIFLASH_URL = os.getenv("APIFLASH_URL", "https://api.apiflash.com/v1/urltoimage")
 
 # Screenshot Configuration
 SCREENSHOT_WIDTH = int(os.getenv("SCREENSHOT_WIDTH", 2440))
 SCREENSHOT_HEIGHT = int(os.getenv("SCREENSHOT_HEIGHT", 2000))
 SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", 100))
+# Именованные области дашборда для /screenshot <область>:
+# JSON {"revenue": [x, y, ширина, высота], ...} в пикселях полного скриншота
+SCREENSHOT_REGIONS = json.loads(os.getenv("SCREENSHOT_REGIONS", "{}"))
+# Захватывать только PNG и получать JPEG/WebP локальным перекодированием
+SCREENSHOT_TRANSCODE = os.getenv("SCREENSHOT_TRANSCODE", "false").lower() == "true"
+# Предпросмотр: 'off' - сразу документ, 'progressive' - уменьшенное фото, затем документ,
+# 'button' - уменьшенное фото с кнопкой загрузки полного документа
+SCREENSHOT_PREVIEW = os.getenv("SCREENSHOT_PREVIEW", "off").lower()
+SCREENSHOT_PREVIEW_WIDTH = int(os.getenv("SCREENSHOT_PREVIEW_WIDTH", 1200))
+SCREENSHOT_PREVIEW_QUALITY = int(os.getenv("SCREENSHOT_PREVIEW_QUALITY", 80))
+# Сравнение с последним скриншотом, отправленным в чат: без изменений - короткий ответ
+# вместо загрузки файла; порог разницы яркости пикселя и фрагмент с изменениями
+SCREENSHOT_DIFF = os.getenv("SCREENSHOT_DIFF", "false").lower() == "true"
+SCREENSHOT_DIFF_THRESHOLD = int(os.getenv("SCREENSHOT_DIFF_THRESHOLD", 24))
+SCREENSHOT_DIFF_HIGHLIGHT = os.getenv("SCREENSHOT_DIFF_HIGHLIGHT", "false").lower() == "true"
+
+# Image Processing Pool Configuration
+# Потоки обработки изображений (0 - по числу ядер) и глубина очереди сверх них
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 0))
+IMAGE_QUEUE_DEPTH = int(os.getenv("IMAGE_QUEUE_DEPTH", 8))
+# Изображения выше этого порога улучшаются параллельно горизонтальными полосами
+ENHANCE_STRIP_MIN_HEIGHT = int(os.getenv("ENHANCE_STRIP_MIN_HEIGHT", 4000))
+ENHANCE_STRIP_WORKERS = int(os.getenv("ENHANCE_STRIP_WORKERS", 0))
+# Срок хранения улучшенных изображений (и их file_id в Telegram), секунды
+ENHANCE_CACHE_TTL = int(os.getenv("ENHANCE_CACHE_TTL", 7 * 24 * 3600))
+# Исходники отправленных скриншотов для улучшения без скачивания из Telegram
+ORIGINALS_TTL = int(os.getenv("ORIGINALS_TTL", 600))
+ORIGINALS_MAX_MB = int(os.getenv("ORIGINALS_MAX_MB", 64))
+# Подбор кодирования минимального размера: порог SSIM для вариантов с потерями
+# и целевой размер файла в КБ (0 - без ограничения, только порог SSIM).
+# По умолчанию выключен: подбор занимает секунды на каждый новый захват
+IMAGE_OPTIMIZE = os.getenv("IMAGE_OPTIMIZE", "false").lower() == "true"
+IMAGE_OPTIMIZE_MIN_SSIM = float(os.getenv("IMAGE_OPTIMIZE_MIN_SSIM", 0.997))
+IMAGE_OPTIMIZE_TARGET_KB = int(os.getenv("IMAGE_OPTIMIZE_TARGET_KB", 0))
+IMAGE_OPTIMIZE_PALETTE_COLORS = int(os.getenv("IMAGE_OPTIMIZE_PALETTE_COLORS", 256))
+
+# HTTP Client Configuration
+APIFLASH_POOL_LIMIT = int(os.getenv("APIFLASH_POOL_LIMIT", 20))
+APIFLASH_LIMIT_PER_HOST = int(os.getenv("APIFLASH_LIMIT_PER_HOST", 10))
+APIFLASH_KEEPALIVE_TIMEOUT = float(os.getenv("APIFLASH_KEEPALIVE_TIMEOUT", 60))
+APIFLASH_CONNECT_TIMEOUT = float(os.getenv("APIFLASH_CONNECT_TIMEOUT", 10))
+APIFLASH_TOTAL_TIMEOUT = float(os.getenv("APIFLASH_TOTAL_TIMEOUT", 90))
+APIFLASH_DNS_CACHE_TTL = int(os.getenv("APIFLASH_DNS_CACHE_TTL", 300))
+# Потоковая загрузка: размер чанка и предельный размер ответа
+APIFLASH_CHUNK_SIZE = int(os.getenv("APIFLASH_CHUNK_SIZE", 64 * 1024))
+APIFLASH_MAX_BYTES = int(os.getenv("APIFLASH_MAX_BYTES", 50 * 1024 * 1024))
+
+# APIFlash Scheduler Configuration
+APIFLASH_MAX_CONCURRENCY = int(os.getenv("APIFLASH_MAX_CONCURRENCY", 3))
+APIFLASH_RATE_PER_MINUTE = float(os.getenv("APIFLASH_RATE_PER_MINUTE", 30))
+APIFLASH_BURST = int(os.getenv("APIFLASH_BURST", 5))
+APIFLASH_MONTHLY_QUOTA = int(os.getenv("APIFLASH_MONTHLY_QUOTA", 0))  # 0 - без ограничения
+APIFLASH_QUOTA_FILE = os.getenv("APIFLASH_QUOTA_FILE", "apiflash_quota.json")
+
+# APIFlash Resilience Configuration
+APIFLASH_ATTEMPT_TIMEOUT = float(os.getenv("APIFLASH_ATTEMPT_TIMEOUT", 45))
+APIFLASH_RETRIES = int(os.getenv("APIFLASH_RETRIES", 2))
+APIFLASH_BACKOFF_BASE = float(os.getenv("APIFLASH_BACKOFF_BASE", 1.0))
+APIFLASH_BACKOFF_MAX = float(os.getenv("APIFLASH_BACKOFF_MAX", 10.0))
+# Дублирующий запрос, если ответ не пришёл за p95 обычной задержки
+APIFLASH_HEDGE = os.getenv("APIFLASH_HEDGE", "false").lower() == "true"
+APIFLASH_BREAKER_THRESHOLD = int(os.getenv("APIFLASH_BREAKER_THRESHOLD", 5))
+APIFLASH_BREAKER_RECOVERY = float(os.getenv("APIFLASH_BREAKER_RECOVERY", 60))
+
+# Cache Configuration
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+CACHE_MAX_SIZE_MB = int(os.getenv("CACHE_MAX_SIZE_MB", 500))
+CACHE_MEMORY_MAX_MB = int(os.getenv("CACHE_MEMORY_MAX_MB", 64))
+# После мягкого TTL запись отдаётся сразу и обновляется в фоне, после жёсткого - промах
+CACHE_SOFT_TTL = int(os.getenv("CACHE_SOFT_TTL", 1800))
+CACHE_HARD_TTL = int(os.getenv("CACHE_HARD_TTL", 3600))
+# Интервал сброса статистики обращений в индекс кэша (SQLite), секунды
+CACHE_INDEX_FLUSH_INTERVAL = float(os.getenv("CACHE_INDEX_FLUSH_INTERVAL", 5))
+# Политика вытеснения с диска: 'lru', 'lfu' или 'gdsf' (учитывает частоту и размер)
+CACHE_EVICTION_POLICY = os.getenv("CACHE_EVICTION_POLICY", "lru").lower()
+# Потоки для чтения и записи файлов кэша вне event loop
+CACHE_IO_WORKERS = int(os.getenv("CACHE_IO_WORKERS", 4))
+# Валидация кэша: 'hourly' - по часовым интервалам, 'fingerprint' - по отпечатку данных таблицы
+CACHE_VALIDATION = os.getenv("CACHE_VALIDATION", "hourly")
+CACHE_FINGERPRINT_RANGES = [
+    r.strip() for r in os.getenv("CACHE_FINGERPRINT_RANGES", SHEET_NAME).split(";") if r.strip()
+]
+CACHE_FINGERPRINT_CHECK_INTERVAL = float(os.getenv("CACHE_FINGERPRINT_CHECK_INTERVAL", 30))
+CACHE_FINGERPRINT_MAX_AGE = int(os.getenv("CACHE_FINGERPRINT_MAX_AGE", 86400))
+
+# Cache Prewarming Configuration
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() == "true"
+PREWARM_LOG_FILE = os.getenv("PREWARM_LOG_FILE", "request_log.json")
+PREWARM_DAILY_BUDGET = int(os.getenv("PREWARM_DAILY_BUDGET", 24))
+PREWARM_LEAD_MINUTES = int(os.getenv("PREWARM_LEAD_MINUTES", 5))
+PREWARM_SLOT_MINUTES = int(os.getenv("PREWARM_SLOT_MINUTES", 15))
+PREWARM_MIN_DAYS = int(os.getenv("PREWARM_MIN_DAYS", 2))
+
+# Native Dashboard Renderer Configuration
+# Рендер дашборда из данных таблицы без APIFlash (/screenshot native),
+# требует credentials.json сервисного аккаунта Google
+NATIVE_RENDER_ENABLED = os.getenv("NATIVE_RENDER_ENABLED", "false").lower() == "true"
+NATIVE_RENDER_WIDTH = int(os.getenv("NATIVE_RENDER_WIDTH", 1600))
+NATIVE_RENDER_HEIGHT = int(os.getenv("NATIVE_RENDER_HEIGHT", 900))
+NATIVE_RENDER_HISTORY_DAYS = int(os.getenv("NATIVE_RENDER_HISTORY_DAYS", 7))
 
 # Проверка конфигурации
 required_vars = {
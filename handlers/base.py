@@ -3,16 +3,32 @@ from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.enums import ParseMode
+from aiogram.utils.text_decorations import markdown_decoration
 
+from keyboards.inline import KeyboardFactory
 from services.screenshot import ScreenshotService
 from services.image_enhancer import ImageEnhancer
+from services.original_store import get_original_store
+from services.worker_pool import PoolSaturatedError, get_image_pool
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 screenshot_service = ScreenshotService()
-image_enhancer = ImageEnhancer()
+# Пул обработки изображений общий с main.py и handlers/callbacks.py
+image_enhancer = ImageEnhancer(worker_pool=get_image_pool())
+original_store = get_original_store()
+
+@router.startup()
+async def on_startup():
+    """Открытие HTTP-сессии сервиса скриншотов"""
+    await screenshot_service.start()
+
+@router.shutdown()
+async def on_shutdown():
+    """Закрытие HTTP-сессии сервиса скриншотов"""
+    await screenshot_service.close()
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
@@ -101,7 +117,7 @@ async def cmd_screenshot(message: Message):
         keyboard.button(text="✨ Улучшить изображение", callback_data="enhance")
 
         # Отправляем скриншот
-        await message.answer_document(
+        sent = await message.answer_document(
             document=screenshot_data,
             filename="screenshot.png",
             caption=(
@@ -114,6 +130,7 @@ async def cmd_screenshot(message: Message):
             parse_mode=ParseMode.MARKDOWN_V2,
             reply_markup=keyboard.as_markup()
         )
+        original_store.put(sent.chat.id, sent.message_id, screenshot_data)
 
     except Exception as e:
         logger.error(f"Error creating screenshot: {e}")
@@ -127,7 +144,20 @@ async def cmd_screenshot(message: Message):
 
 @router.callback_query(F.data == "enhance")
 async def process_enhancement(callback: CallbackQuery):
-    """Обработчик улучшения изображения"""
+    """Обработчик кнопки улучшения: выбор пресета"""
+    await callback.answer()
+    keyboard = KeyboardFactory.preset_keyboard(image_enhancer.get_preset_options())
+    await callback.message.edit_reply_markup(reply_markup=keyboard.as_markup())
+
+@router.callback_query(F.data.startswith("enhance_"))
+async def process_preset_selection(callback: CallbackQuery):
+    """Обработчик улучшения изображения выбранным пресетом"""
+    preset = callback.data[len("enhance_"):]
+    presets = image_enhancer.get_preset_options()
+    if preset not in presets:
+        await callback.answer()
+        return
+
     try:
         await callback.message.edit_text(
             "*Улучшаю изображение\.\.\.*",
@@ -142,22 +172,28 @@ async def process_enhancement(callback: CallbackQuery):
             )
             return
 
-        file = await callback.bot.get_file(callback.message.document.file_id)
-        file_content = await callback.bot.download_file(file.file_path)
+        # Исходник берём из локального хранилища, из Telegram - только при промахе
+        original = original_store.get(callback.message.chat.id, callback.message.message_id)
+        if original is None:
+            file = await callback.bot.get_file(callback.message.document.file_id)
+            original = (await callback.bot.download_file(file.file_path)).read()
 
         # Улучшаем изображение
-        enhanced_data = await image_enhancer.enhance_screenshot(
-            file_content.read(),
-            clip_limit=1.2,
-            sharpness=3.8
-        )
+        enhanced_data = await image_enhancer.enhance_preset(original, preset)
+        if not enhanced_data:
+            await callback.message.answer(
+                "❌ *Ошибка при улучшении изображения*",
+                parse_mode=ParseMode.MARKDOWN_V2
+            )
+            return
 
         # Отправляем улучшенное изображение
         await callback.message.answer_document(
             document=enhanced_data,
-            filename="screenshot_enhanced.png",
+            filename=f"screenshot_{preset}.png",
             caption=(
                 "✨ *Изображение улучшено\!*\n\n"
+                f"*Пресет:* {markdown_decoration.quote(presets[preset])}\n"
                 "*Применённые улучшения:*\n"
                 "• Повышенный контраст\n"
                 "• Увеличенная резкость\n"
@@ -166,6 +202,12 @@ async def process_enhancement(callback: CallbackQuery):
             parse_mode=ParseMode.MARKDOWN_V2
         )
 
+    except PoolSaturatedError:
+        await callback.message.answer(
+            "⏳ *Сейчас обрабатывается слишком много изображений*\n"
+            "Попробуйте через минуту",
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
     except Exception as e:
         logger.error(f"Error enhancing image: {e}")
         await callback.message.edit_text(
@@ -3,13 +3,19 @@ from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.enums import ParseMode
+from aiogram.utils.text_decorations import markdown_decoration
 
+from keyboards.inline import KeyboardFactory
 from states.dialog import ScreenshotDialog
 from services.image_enhancer import ImageEnhancer
+from services.original_store import get_original_store
+from services.worker_pool import PoolSaturatedError, get_image_pool
 
 logger = logging.getLogger(__name__)
 router = Router()
-image_enhancer = ImageEnhancer()
+# Пул обработки изображений общий с main.py и handlers/base.py
+image_enhancer = ImageEnhancer(worker_pool=get_image_pool())
+original_store = get_original_store()
 
 @router.callback_query(lambda c: c.data.startswith("format_"))
 async def process_format_selection(callback: CallbackQuery, state: FSMContext):
@@ -38,8 +44,21 @@ async def process_format_selection(callback: CallbackQuery, state: FSMContext):
         )
 
 @router.callback_query(F.data == "enhance")
-async def process_enhancement(callback: CallbackQuery, state: FSMContext):
-    """Обработчик улучшения изображения"""
+async def process_enhancement(callback: CallbackQuery):
+    """Обработчик кнопки улучшения: выбор пресета"""
+    await callback.answer()
+    keyboard = KeyboardFactory.preset_keyboard(image_enhancer.get_preset_options())
+    await callback.message.edit_reply_markup(reply_markup=keyboard.as_markup())
+
+@router.callback_query(F.data.startswith("enhance_"))
+async def process_preset_selection(callback: CallbackQuery, state: FSMContext):
+    """Обработчик улучшения изображения выбранным пресетом"""
+    preset = callback.data[len("enhance_"):]
+    presets = image_enhancer.get_preset_options()
+    if preset not in presets:
+        await callback.answer()
+        return
+
     try:
         await callback.message.edit_text(
             "🔄 *Улучшаю изображение...*\n"
@@ -58,23 +77,26 @@ async def process_enhancement(callback: CallbackQuery, state: FSMContext):
             )
             return
 
-        file = await callback.bot.get_file(message.document.file_id)
-        file_content = await callback.bot.download_file(file.file_path)
+        # Исходник берём из локального хранилища, из Telegram - только при промахе
+        original = original_store.get(message.chat.id, message.message_id)
+        if original is None:
+            file = await callback.bot.get_file(message.document.file_id)
+            original = (await callback.bot.download_file(file.file_path)).read()
 
         logger.info(f"Enhancing image for user {callback.from_user.id}")
-        # Улучшаем изображение
-        enhanced_data = image_enhancer.enhance_screenshot(
-            file_content.read(),
-            clip_limit=1.2,  # Увеличенный контраст
-            sharpness=3.8    # Повышенная резкость
-        )
+        # Улучшаем изображение в общем пуле, не блокируя event loop
+        enhanced_data = await image_enhancer.enhance_preset(original, preset)
+        if not enhanced_data:
+            await callback.message.answer("❌ Ошибка при улучшении изображения")
+            return
 
         # Отправляем улучшенное изображение
         await message.answer_document(
             document=enhanced_data,
-            filename='screenshot_enhanced.png',
+            filename=f'screenshot_{preset}.png',
             caption=(
                 "✨ *Изображение улучшено!*\n\n"
+                f"*Пресет:* {markdown_decoration.quote(presets[preset])}\n"
                 "*Применённые улучшения:*\n"
                 "• Повышенный контраст\n"
                 "• Увеличенная резкость\n"
@@ -86,6 +108,11 @@ async def process_enhancement(callback: CallbackQuery, state: FSMContext):
         # Сбрасываем состояние
         await state.clear()
 
+    except PoolSaturatedError:
+        await callback.message.answer(
+            "⏳ Сейчас обрабатывается слишком много изображений.\n"
+            "Попробуйте через минуту."
+        )
     except Exception as e:
         logger.error(f"Error in enhancement process: {e}")
         await callback.message.edit_text(
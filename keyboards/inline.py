@@ -19,3 +19,12 @@ class KeyboardFactory:
         builder = InlineKeyboardBuilder()
         builder.button(text="✨ Улучшить изображение", callback_data="enhance")
         return builder
+
+    @staticmethod
+    def preset_keyboard(presets: Dict[str, str]) -> InlineKeyboardBuilder:
+        """Создает клавиатуру для выбора пресета улучшения"""
+        builder = InlineKeyboardBuilder()
+        for name, title in presets.items():
+            builder.button(text=title, callback_data=f"enhance_{name}")
+        builder.adjust(1)
+        return builder
@@ -1,9 +1,57 @@
 import logging
+from datetime import datetime
+from typing import Optional, Tuple
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from config import TELEGRAM_TOKEN, logger
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
+from config import (
+    TELEGRAM_TOKEN,
+    SCREENSHOT_WIDTH,
+    SCREENSHOT_PREVIEW,
+    SCREENSHOT_PREVIEW_WIDTH,
+    SCREENSHOT_PREVIEW_QUALITY,
+    SCREENSHOT_DIFF,
+    SCREENSHOT_DIFF_THRESHOLD,
+    SCREENSHOT_DIFF_HIGHLIGHT,
+    CACHE_DIR,
+    CACHE_MAX_SIZE_MB,
+    CACHE_MEMORY_MAX_MB,
+    CACHE_SOFT_TTL,
+    CACHE_HARD_TTL,
+    CACHE_INDEX_FLUSH_INTERVAL,
+    CACHE_EVICTION_POLICY,
+    CACHE_IO_WORKERS,
+    CACHE_VALIDATION,
+    CACHE_FINGERPRINT_RANGES,
+    CACHE_FINGERPRINT_MAX_AGE,
+    PREWARM_ENABLED,
+    PREWARM_LOG_FILE,
+    PREWARM_DAILY_BUDGET,
+    PREWARM_LEAD_MINUTES,
+    PREWARM_SLOT_MINUTES,
+    PREWARM_MIN_DAYS,
+    ENHANCE_CACHE_TTL,
+    NATIVE_RENDER_ENABLED,
+    NATIVE_RENDER_WIDTH,
+    NATIVE_RENDER_HEIGHT,
+    NATIVE_RENDER_HISTORY_DAYS,
+    logger
+)
+from services.cache_manager import CacheManager
+from services.cache_prewarmer import CachePrewarmer
+from services.dashboard_renderer import NativeDashboardRenderer
 from services.screenshot_service import ScreenshotService
-from services.image_enhancer import ImageEnhancer
+from services.bot_metrics import BotMetrics
+from services.enhancement_cache import EnhancementCache
+from services.file_id_cache import FileIdCache
+from services.image_codec import preview
+from services.image_diff import DiffTracker, highlight
+from services.image_enhancer import ImageEnhancer, PRESETS
+from services.image_optimizer import get_image_optimizer
+from services.original_store import get_original_store
+from services.worker_pool import PoolSaturatedError, get_image_pool
+import asyncio
 import io
 import os
 import signal
@@ -11,8 +59,72 @@ import sys
 import psutil
 
 # Инициализация сервисов
-screenshot_service = ScreenshotService()
-image_enhancer = ImageEnhancer()
+cache_manager = CacheManager(
+    cache_dir=CACHE_DIR,
+    max_size_mb=CACHE_MAX_SIZE_MB,
+    memory_max_mb=CACHE_MEMORY_MAX_MB,
+    ttl_seconds=CACHE_HARD_TTL,
+    soft_ttl_seconds=CACHE_SOFT_TTL,
+    fingerprint_ttl_seconds=CACHE_FINGERPRINT_MAX_AGE,
+    index_flush_interval=CACHE_INDEX_FLUSH_INTERVAL,
+    eviction_policy=CACHE_EVICTION_POLICY,
+    io_workers=CACHE_IO_WORKERS
+)
+
+def create_sheets_service():
+    """Клиент Google Sheets, если он нужен для валидации кэша или нативного рендера"""
+    if CACHE_VALIDATION != 'fingerprint' and not NATIVE_RENDER_ENABLED:
+        return None
+    try:
+        from services.google_sheets import GoogleSheetsService
+    except ImportError as e:
+        logger.warning(
+            f"Google Sheets features disabled: {e}. "
+            "Install google-api-python-client and google-auth to use "
+            "CACHE_VALIDATION=fingerprint or NATIVE_RENDER_ENABLED"
+        )
+        return None
+    try:
+        return GoogleSheetsService()
+    except Exception as e:
+        logger.error(f"Google Sheets features disabled: {e}")
+        return None
+
+def create_fingerprint_provider():
+    """Источник отпечатка данных таблицы для валидации кэша"""
+    if CACHE_VALIDATION != 'fingerprint' or sheets_service is None:
+        return None
+    return lambda: sheets_service.get_data_fingerprint(CACHE_FINGERPRINT_RANGES)
+
+sheets_service = create_sheets_service()
+screenshot_service = ScreenshotService(
+    cache_manager=cache_manager,
+    fingerprint_provider=create_fingerprint_provider(),
+    optimizer=get_image_optimizer()
+)
+if NATIVE_RENDER_ENABLED and sheets_service is not None:
+    screenshot_service.register_renderer(NativeDashboardRenderer(
+        sheets_service,
+        worker_pool=screenshot_service.worker_pool,
+        width=NATIVE_RENDER_WIDTH,
+        height=NATIVE_RENDER_HEIGHT,
+        history_days=NATIVE_RENDER_HISTORY_DAYS
+    ))
+cache_prewarmer = CachePrewarmer(
+    screenshot_service,
+    cache_manager,
+    log_file=PREWARM_LOG_FILE,
+    daily_budget=PREWARM_DAILY_BUDGET,
+    slot_minutes=PREWARM_SLOT_MINUTES,
+    lead_minutes=PREWARM_LEAD_MINUTES,
+    min_days=PREWARM_MIN_DAYS
+)
+bot_metrics = BotMetrics()
+image_enhancer = ImageEnhancer(metrics=bot_metrics, optimizer=get_image_optimizer())
+enhancement_cache = EnhancementCache(cache_manager, ttl_seconds=ENHANCE_CACHE_TTL)
+original_store = get_original_store()
+diff_tracker = DiffTracker(threshold=SCREENSHOT_DIFF_THRESHOLD)
+file_id_cache = FileIdCache()
 
 def is_bot_already_running() -> bool:
     """Проверяет, запущен ли уже бот"""
@@ -58,6 +170,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "*Основные команды:*\n"
         "🔸 /start \- Начало работы\n"
         "🔸 /screenshot \- Создание скриншота\n"
+        "🔸 /screenshot native \- Быстрый рендер из данных таблицы\n"
+        "🔸 /screenshot <область> \- Фрагмент дашборда\n"
         "🔸 /format \- Выбор формата изображения\n\n"
         "*Параметры скриншота:*\n"
         "• Разрешение: 2440x2000\n"
@@ -97,9 +211,145 @@ async def handle_format_selection(update: Update, context: ContextTypes.DEFAULT_
         parse_mode='MarkdownV2'
     )
 
+def screenshot_caption(format_type: str, region: Optional[str] = None, fallback: bool = False) -> str:
+    """Подпись к документу со скриншотом"""
+    return (
+        "✅ *Скриншот готов\!*\n\n"
+        "*Параметры:*\n"
+        f"• Формат: {format_type.upper()}\n"
+        + (
+            f"• Режим: Область «{escape_markdown(region, version=2)}»"
+            if region is not None else
+            "• Разрешение: 2440x2000\n"
+            "• Качество: 100%\n"
+            "• Режим: Полная страница"
+        )
+        + (
+            "\n\n⚠️ _Сервис скриншотов недоступен, показана последняя сохранённая версия_"
+            if fallback else ""
+        )
+    )
+
+async def reply_with_file(reply, field: str, data: bytes, **kwargs):
+    """Отправка файла с повторным использованием file_id для уже загруженного содержимого
+
+    Args:
+        reply: Метод сообщения (reply_document или reply_photo)
+        field: Имя параметра файла ('document' или 'photo')
+        data: Содержимое файла
+    """
+    digest = file_id_cache.digest(data)
+    file_id = file_id_cache.get(digest, len(data))
+    if file_id is not None:
+        try:
+            return await reply(**{field: file_id}, **kwargs)
+        except BadRequest as e:
+            logger.warning(f"Cached file_id rejected by Telegram: {e}")
+            file_id_cache.forget(digest)
+
+    # bytes передаются напрямую, без промежуточной копии в BytesIO
+    sent = await reply(**{field: data}, **kwargs)
+    uploaded = sent.document if field == 'document' else sent.photo[-1]
+    file_id_cache.remember(digest, uploaded.file_id)
+    return sent
+
+async def send_screenshot_document(message, screenshot_data: bytes, format_type: str,
+                                   region: Optional[str] = None, fallback: bool = False):
+    """Отправка полного скриншота документом с кнопкой улучшения"""
+    keyboard = [[InlineKeyboardButton("✨ Улучшить изображение", callback_data="enhance")]]
+
+    sent = await reply_with_file(
+        message.reply_document,
+        'document',
+        screenshot_data,
+        filename=f"{region or 'screenshot'}.{format_type}",
+        caption=screenshot_caption(format_type, region, fallback),
+        parse_mode='MarkdownV2',
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    # Исходник нужен для улучшения: так его не придётся скачивать обратно
+    original_store.put(sent.chat_id, sent.message_id, screenshot_data)
+    return sent
+
+async def send_preview(message, screenshot_data: bytes, format_type: str,
+                       region: Optional[str] = None, source_width: int = 0) -> bool:
+    """Отправка уменьшенного фото до полного документа.
+
+    В режиме 'button' полный документ загружается по кнопке, исходник
+    хранится в original_store под сообщением с предпросмотром.
+    """
+    try:
+        preview_data = await get_image_pool().run(
+            preview, screenshot_data, SCREENSHOT_PREVIEW_WIDTH,
+            SCREENSHOT_PREVIEW_QUALITY, source_width
+        )
+    except Exception as e:
+        # Без предпросмотра пользователь просто получит документ
+        logger.warning(f"Preview skipped: {e}")
+        return False
+
+    if SCREENSHOT_PREVIEW == 'button':
+        callback = f"full:{format_type}:{region or ''}"
+        sent = await reply_with_file(
+            message.reply_photo,
+            'photo',
+            preview_data,
+            caption="👀 *Предпросмотр*",
+            parse_mode='MarkdownV2',
+            reply_markup=InlineKeyboardMarkup(
+                [[InlineKeyboardButton("📄 Полное качество", callback_data=callback)]]
+            )
+        )
+        original_store.put(sent.chat_id, sent.message_id, screenshot_data)
+    else:
+        await reply_with_file(
+            message.reply_photo,
+            'photo',
+            preview_data,
+            caption="👀 *Предпросмотр*\nПолное изображение загружается\.\.\.",
+            parse_mode='MarkdownV2'
+        )
+    return True
+
+async def send_unchanged_notice(message, screenshot_data: bytes, format_type: str,
+                                region: Optional[str], since: Optional[datetime]):
+    """Ответ вместо повторной загрузки неизменившегося дашборда"""
+    callback = f"full:{format_type}:{region or ''}"
+    sent = await message.reply_text(
+        f"💤 *Без изменений с {since.strftime('%H:%M') if since else '—'}*",
+        parse_mode='MarkdownV2',
+        reply_markup=InlineKeyboardMarkup(
+            [[InlineKeyboardButton("📄 Отправить всё равно", callback_data=callback)]]
+        )
+    )
+    # Кнопка отправляет текущий скриншот тем же обработчиком, что и под предпросмотром
+    original_store.put(sent.chat_id, sent.message_id, screenshot_data)
+
+async def send_changes(message, screenshot_data: bytes, box: Tuple[int, int, int, int],
+                       since: Optional[datetime]):
+    """Отправка фрагмента дашборда, изменившегося с прошлого скриншота"""
+    try:
+        fragment = await get_image_pool().run(highlight, screenshot_data, box)
+        await message.reply_photo(
+            photo=fragment,
+            caption=f"🔍 *Изменения с {since.strftime('%H:%M')}*" if since else "🔍 *Изменения*",
+            parse_mode='MarkdownV2'
+        )
+    except Exception as e:
+        logger.warning(f"Failed to send changed region: {e}")
+
 async def screenshot_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды создания скриншота"""
+    # Время до первого изображения и до полного документа учитываются отдельно
+    started = bot_metrics.start_command_tracking("screenshot")
     format_type = context.user_data.get('format', 'png')
+    # /screenshot native - рендер из данных таблицы без APIFlash,
+    # /screenshot <область> - фрагмент дашборда из сохранённого полного скриншота
+    target = context.args[0].lower() if context.args else None
+    region = target if target in screenshot_service.regions else None
+    renderer = target if region is None else None
+    if target is None:
+        cache_prewarmer.record_request(format_type)
 
     # Отправляем сообщение о начале процесса
     message = await update.message.reply_text(
@@ -108,11 +358,37 @@ async def screenshot_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         parse_mode='MarkdownV2'
     )
 
+    async def notify_queued(position: int, estimated_wait: float):
+        """Сообщаем пользователю о положении в очереди к APIFlash"""
+        try:
+            await message.edit_text(
+                "⏳ *Запрос в очереди*\n"
+                f"Позиция: {position}, ожидание около {int(estimated_wait)} с",
+                parse_mode='MarkdownV2'
+            )
+        except Exception as e:
+            logger.warning(f"Failed to update queue status: {e}")
+
     try:
-        # Получаем скриншот
-        screenshot_data = await screenshot_service.get_screenshot(format_type)
+        # Получаем скриншот (одновременные одинаковые запросы объединяются)
+        if region is not None:
+            result = await screenshot_service.get_region_result(
+                region,
+                format_type,
+                on_queued=notify_queued
+            )
+        else:
+            result = await screenshot_service.get_screenshot_result(
+                format_type,
+                on_queued=notify_queued,
+                renderer=renderer
+            )
+        screenshot_data = result.data
+        if result.shared:
+            logger.info(f"Screenshot request joined an in-flight capture ({format_type})")
 
         if not screenshot_data:
+            bot_metrics.end_command_tracking("screenshot:full_document", started, success=False)
             await message.edit_text(
                 "❌ *Ошибка при создании скриншота*\n"
                 "Попробуйте позже",
@@ -120,70 +396,151 @@ async def screenshot_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
             return
 
-        # Создаем кнопку для улучшения
-        keyboard = [[InlineKeyboardButton("✨ Улучшить изображение", callback_data="enhance")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        # Отправляем файл
-        await update.message.reply_document(
-            document=io.BytesIO(screenshot_data),
-            filename=f"screenshot.{format_type}",
-            caption=(
-                "✅ *Скриншот готов\!*\n\n"
-                "*Параметры:*\n"
-                f"• Формат: {format_type.upper()}\n"
-                "• Разрешение: 2440x2000\n"
-                "• Качество: 100%\n"
-                "• Режим: Полная страница"
-            ),
-            parse_mode='MarkdownV2',
-            reply_markup=reply_markup
-        )
+        # Тот же дашборд, что уже отправлен в этот чат: не загружаем файл повторно.
+        # Сравниваются только изображения одного формата и одного источника
+        diff_key = f"{update.message.chat_id}:{target or 'full'}:{format_type}:{result.renderer}"
+        diff = await diff_tracker.check(diff_key, screenshot_data) if SCREENSHOT_DIFF else None
+        if diff is not None and not diff.changed:
+            await send_unchanged_notice(update.message, screenshot_data, format_type, region, diff.previous_sent_at)
+            await message.delete()
+            bot_metrics.end_command_tracking("screenshot:unchanged", started)
+            return
 
-        await message.delete()
+        # Полноразмерный скриншот APIFlash можно декодировать сразу в уменьшенном виде
+        source_width = SCREENSHOT_WIDTH if target is None else 0
+        previewed = SCREENSHOT_PREVIEW in ('progressive', 'button') \
+            and await send_preview(update.message, screenshot_data, format_type, region, source_width)
+        if previewed:
+            bot_metrics.end_command_tracking("screenshot:first_pixel", started)
+            await message.delete()
+            if diff is not None:
+                diff_tracker.remember(diff_key, diff)
+            if SCREENSHOT_PREVIEW == 'button':
+                # Полный документ - по кнопке под предпросмотром
+                return
+
+        await send_screenshot_document(update.message, screenshot_data, format_type, region, result.fallback)
+        if not previewed:
+            bot_metrics.end_command_tracking("screenshot:first_pixel", started)
+            await message.delete()
+            if diff is not None:
+                diff_tracker.remember(diff_key, diff)
+        bot_metrics.end_command_tracking("screenshot:full_document", started)
+
+        if diff is not None and diff.box is not None and SCREENSHOT_DIFF_HIGHLIGHT:
+            await send_changes(update.message, screenshot_data, diff.box, diff.previous_sent_at)
 
     except Exception as e:
         logger.error(f"Error creating screenshot: {e}")
+        bot_metrics.end_command_tracking("screenshot:full_document", started, success=False)
         await message.edit_text(
             "❌ *Произошла ошибка*\n"
             "Попробуйте позже",
             parse_mode='MarkdownV2'
         )
 
+async def handle_full_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик кнопки загрузки полного документа под предпросмотром"""
+    query = update.callback_query
+    _, format_type, region = query.data.split(':', 2)
+
+    screenshot_data = original_store.get(query.message.chat_id, query.message.message_id)
+    if screenshot_data is None:
+        await query.answer("Скриншот устарел, запросите новый: /screenshot", show_alert=True)
+        return
+
+    await query.answer()
+    try:
+        await send_screenshot_document(query.message, screenshot_data, format_type, region or None)
+        await query.edit_message_reply_markup(reply_markup=None)
+    except Exception as e:
+        logger.error(f"Error sending full document: {e}")
+
 async def handle_enhancement(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик улучшения изображения"""
+    """Обработчик кнопки улучшения: выбор пресета"""
     query = update.callback_query
     await query.answer()
 
-    try:
-        # Получаем файл
-        file_id = query.message.document.file_id
-        file = await context.bot.get_file(file_id)
-        file_data = await file.download_as_bytearray()
+    keyboard = [
+        [InlineKeyboardButton(title, callback_data=f"enhance_{name}")]
+        for name, title in image_enhancer.get_preset_options().items()
+    ]
+    await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup(keyboard))
+
+def enhanced_caption(preset: str) -> str:
+    """Подпись к улучшенному изображению"""
+    title = escape_markdown(image_enhancer.get_preset_options()[preset], version=2)
+    return (
+        "✨ *Изображение улучшено\!*\n\n"
+        f"*Пресет:* {title}\n"
+        "*Применённые улучшения:*\n"
+        "• Повышенный контраст\n"
+        "• Увеличенная резкость"
+    )
 
-        # Улучшаем изображение
-        enhanced_data = await image_enhancer.enhance_image(file_data)
+async def handle_preset_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик улучшения изображения выбранным пресетом"""
+    query = update.callback_query
+    await query.answer()
+    preset = query.data[len("enhance_"):]
+    if preset not in PRESETS:
+        return
 
-        if not enhanced_data:
-            await query.edit_message_text(
-                "❌ *Ошибка при улучшении изображения*",
-                parse_mode='MarkdownV2'
-            )
-            return
+    try:
+        document = query.message.document
+        cached = await enhancement_cache.lookup(document.file_unique_id, PRESETS[preset])
+
+        # Этот результат уже отправлялся: повторно используем загруженный файл
+        if cached is not None and cached.file_id:
+            try:
+                await query.message.reply_document(
+                    document=cached.file_id,
+                    caption=enhanced_caption(preset),
+                    parse_mode='MarkdownV2'
+                )
+                return
+            except BadRequest as e:
+                logger.warning(f"Cached enhanced file_id rejected: {e}")
+                await enhancement_cache.remember_file_id(document.file_unique_id, PRESETS[preset], None)
+                # Сохранённые байты загружаются заново, повторное улучшение нужно только при их отсутствии
+                cached.data = await enhancement_cache.get_data(document.file_unique_id, PRESETS[preset])
+
+        if cached is not None and cached.data:
+            enhanced_data = cached.data
+        else:
+            # Исходник берём из локального хранилища, из Telegram - только при промахе
+            file_data = original_store.get(query.message.chat_id, query.message.message_id)
+            if file_data is None:
+                file = await context.bot.get_file(document.file_id)
+                file_data = await file.download_as_bytearray()
+
+            # Улучшаем изображение (в общем пуле, event loop не блокируется)
+            try:
+                enhanced_data = await image_enhancer.enhance_preset(file_data, preset)
+            except PoolSaturatedError:
+                await query.message.reply_text(
+                    "⏳ *Сейчас обрабатывается слишком много изображений*\n"
+                    "Попробуйте через минуту",
+                    parse_mode='MarkdownV2'
+                )
+                return
+
+            if not enhanced_data:
+                await query.edit_message_text(
+                    "❌ *Ошибка при улучшении изображения*",
+                    parse_mode='MarkdownV2'
+                )
+                return
+            await enhancement_cache.store(document.file_unique_id, PRESETS[preset], enhanced_data)
 
         # Отправляем улучшенное изображение
-        await query.message.reply_document(
+        sent = await query.message.reply_document(
             document=io.BytesIO(enhanced_data),
-            filename="screenshot_enhanced.png",
-            caption=(
-                "✨ *Изображение улучшено\!*\n\n"
-                "*Применённые улучшения:*\n"
-                "• Повышенный контраст\n"
-                "• Увеличенная резкость\n"
-                "• Оптимизация цветов"
-            ),
+            filename=f"screenshot_{preset}.png",
+            caption=enhanced_caption(preset),
             parse_mode='MarkdownV2'
         )
+        await enhancement_cache.remember_file_id(document.file_unique_id, PRESETS[preset], sent.document.file_id)
 
     except Exception as e:
         logger.error(f"Error enhancing image: {e}")
@@ -192,6 +549,29 @@ async def handle_enhancement(update: Update, context: ContextTypes.DEFAULT_TYPE)
             parse_mode='MarkdownV2'
         )
 
+async def flush_cache_index():
+    """Периодический сброс статистики обращений к кэшу, даже если обращений больше нет"""
+    while True:
+        await asyncio.sleep(CACHE_INDEX_FLUSH_INTERVAL)
+        await cache_manager.aflush()
+
+async def on_startup(application: Application):
+    """Инициализация долгоживущих ресурсов при запуске приложения"""
+    await screenshot_service.start()
+    if PREWARM_ENABLED:
+        cache_prewarmer.start()
+    application.bot_data['cache_flush_task'] = asyncio.create_task(flush_cache_index())
+
+async def on_shutdown(application: Application):
+    """Освобождение ресурсов при остановке приложения"""
+    flush_task = application.bot_data.pop('cache_flush_task', None)
+    if flush_task is not None:
+        flush_task.cancel()
+    await cache_prewarmer.stop()
+    await screenshot_service.close()
+    cache_manager.close()
+    get_image_pool().shutdown(wait=False)
+
 def main():
     """Запуск бота"""
     try:
@@ -199,7 +579,13 @@ def main():
         cleanup_processes()
 
         # Создаем приложение
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(on_startup)
+            .post_shutdown(on_shutdown)
+            .build()
+        )
 
         # Добавляем обработчики команд
         application.add_handler(CommandHandler("start", start))
@@ -210,6 +596,8 @@ def main():
         # Добавляем обработчики callback
         application.add_handler(CallbackQueryHandler(handle_format_selection, pattern="^format_"))
         application.add_handler(CallbackQueryHandler(handle_enhancement, pattern="^enhance$"))
+        application.add_handler(CallbackQueryHandler(handle_preset_selection, pattern="^enhance_"))
+        application.add_handler(CallbackQueryHandler(handle_full_document, pattern="^full:"))
 
         # Запускаем бота
         logger.info("Starting bot...")
@@ -0,0 +1,235 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import IntEnum
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+from utils.logger import logger
+
+class Priority(IntEnum):
+    """Классы приоритета запросов к APIFlash (меньше - важнее)"""
+    INTERACTIVE = 0  # /screenshot от пользователя
+    AUTO_REPORT = 1  # автоматические отчёты
+    PREWARM = 2      # прогрев кэша
+
+class QuotaExceededError(Exception):
+    """Месячная квота APIFlash исчерпана"""
+
+@dataclass(order=True)
+class SchedulerTicket:
+    priority: int
+    sequence: int
+    enqueued_at: float = field(compare=False)
+    granted: asyncio.Future = field(compare=False, repr=False)
+    started_at: Optional[float] = field(default=None, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+    @property
+    def wait_time(self) -> float:
+        """Время ожидания в очереди, секунды"""
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+class TokenBucket:
+    """Ограничение частоты запросов по алгоритму token bucket"""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Ожидает и забирает один токен"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+class ApiFlashScheduler:
+    """Планировщик запросов к APIFlash.
+
+    Ограничивает число одновременных запросов, частоту (token bucket) и
+    месячную квоту, сохраняемую на диск. Ожидающие запросы обслуживаются
+    по классам приоритета, внутри класса - в порядке поступления.
+    """
+
+    def __init__(self, max_concurrency: int = 3, rate_per_minute: float = 30, burst: int = 5,
+                 monthly_quota: int = 0, quota_file: str = "apiflash_quota.json"):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.monthly_quota = monthly_quota  # 0 - без ограничения
+        self.quota_file = quota_file
+        self._bucket = TokenBucket(rate_per_minute, burst)
+        self._queue: List[SchedulerTicket] = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._avg_service_time = 10.0
+        self._wait_times: List[float] = []
+        self._notifications: Set[asyncio.Future] = set()
+        self._quota_month, self.quota_used = self._load_quota()
+
+    def _load_quota(self):
+        """Загрузка счётчика квоты текущего месяца"""
+        month = datetime.now().strftime('%Y-%m')
+        try:
+            if os.path.exists(self.quota_file):
+                with open(self.quota_file, 'r') as f:
+                    data = json.load(f)
+                if data.get('month') == month:
+                    return month, int(data.get('used', 0))
+        except Exception as e:
+            logger.error(f"Error loading APIFlash quota: {e}")
+        return month, 0
+
+    def _save_quota(self):
+        """Сохранение счётчика квоты"""
+        try:
+            tmp_file = f"{self.quota_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({'month': self._quota_month, 'used': self.quota_used}, f)
+            os.replace(tmp_file, self.quota_file)
+        except Exception as e:
+            logger.error(f"Error saving APIFlash quota: {e}")
+
+    def _consume_quota(self):
+        """Учёт одного запроса в месячной квоте"""
+        month = datetime.now().strftime('%Y-%m')
+        if month != self._quota_month:
+            self._quota_month, self.quota_used = month, 0
+        if self.monthly_quota and self.quota_used >= self.monthly_quota:
+            raise QuotaExceededError(f"APIFlash monthly quota of {self.monthly_quota} requests exhausted")
+        self.quota_used += 1
+        self._save_quota()
+
+    @property
+    def quota_remaining(self) -> Optional[int]:
+        """Остаток месячной квоты (None - без ограничения)"""
+        if not self.monthly_quota:
+            return None
+        return max(self.monthly_quota - self.quota_used, 0)
+
+    def _dispatch(self):
+        """Выдаёт освободившиеся слоты ожидающим запросам по приоритету"""
+        while self._active < self.max_concurrency and self._queue:
+            ticket = heapq.heappop(self._queue)
+            if ticket.cancelled or ticket.granted.done():
+                continue
+            self._active += 1
+            ticket.started_at = time.monotonic()
+            ticket.granted.set_result(True)
+
+    def queue_position(self, ticket: SchedulerTicket) -> int:
+        """Позиция запроса в очереди (1 - следующий), 0 - уже выполняется"""
+        if ticket.started_at is not None:
+            return 0
+        return 1 + sum(1 for other in self._queue if not other.cancelled and other < ticket)
+
+    def estimate_wait(self, position: int) -> float:
+        """Оценка времени ожидания для позиции в очереди, секунды"""
+        if position <= 0:
+            return 0.0
+        return math.ceil(position / self.max_concurrency) * self._avg_service_time
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE,
+                      on_queued: Optional[Callable[[int, float], Any]] = None) -> SchedulerTicket:
+        """Ожидание слота для запроса к APIFlash
+
+        Args:
+            priority: Класс приоритета
+            on_queued: Вызывается с (позиция, оценка ожидания в секундах), если запрос попал в очередь
+        """
+        if self.monthly_quota and self.quota_used >= self.monthly_quota \
+                and datetime.now().strftime('%Y-%m') == self._quota_month:
+            raise QuotaExceededError(f"APIFlash monthly quota of {self.monthly_quota} requests exhausted")
+
+        loop = asyncio.get_running_loop()
+        ticket = SchedulerTicket(
+            priority=int(priority),
+            sequence=next(self._sequence),
+            enqueued_at=time.monotonic(),
+            granted=loop.create_future()
+        )
+        heapq.heappush(self._queue, ticket)
+        self._dispatch()
+
+        try:
+            if not ticket.granted.done() and on_queued is not None:
+                position = self.queue_position(ticket)
+                result = on_queued(position, self.estimate_wait(position))
+                if asyncio.iscoroutine(result):
+                    # Уведомление не должно задерживать выдачу слота
+                    notification = asyncio.ensure_future(result)
+                    self._notifications.add(notification)
+                    notification.add_done_callback(self._notifications.discard)
+
+            await ticket.granted
+            await self._bucket.acquire()
+            self._consume_quota()
+        except BaseException:
+            ticket.cancelled = True
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                self._release_slot()
+            raise
+
+        self._wait_times.append(ticket.wait_time)
+        self._wait_times = self._wait_times[-100:]
+        if ticket.wait_time > 1:
+            logger.info(
+                f"APIFlash request (priority={Priority(ticket.priority).name}) "
+                f"waited {ticket.wait_time:.1f}s in queue"
+            )
+        return ticket
+
+    def _release_slot(self):
+        self._active -= 1
+        self._dispatch()
+
+    def release(self, ticket: SchedulerTicket):
+        """Освобождение слота после завершения запроса"""
+        if ticket.started_at is not None:
+            service_time = time.monotonic() - ticket.started_at
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+        self._release_slot()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE,
+                   on_queued: Optional[Callable[[int, float], Any]] = None) -> AsyncIterator[SchedulerTicket]:
+        """Контекстный менеджер слота для запроса к APIFlash"""
+        ticket = await self.acquire(priority, on_queued)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика планировщика"""
+        waiting = [t for t in self._queue if not t.cancelled and not t.granted.done()]
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queued": len(waiting),
+            "queued_by_priority": {
+                p.name: sum(1 for t in waiting if t.priority == p) for p in Priority
+            },
+            "avg_wait_time": round(sum(self._wait_times) / len(self._wait_times), 2)
+                             if self._wait_times else 0,
+            "avg_service_time": round(self._avg_service_time, 2),
+            "quota_used": self.quota_used,
+            "quota_remaining": self.quota_remaining
+        }
@@ -144,6 +144,23 @@ class BotMetrics:
                 }
             }
 
+    def get_command_stats(self, prefix: str = "") -> Dict[str, Dict[str, float]]:
+        """Время выполнения по командам с заданным префиксом (например, 'enhance:')"""
+        grouped: Dict[str, List[float]] = {}
+        for metric in self.command_metrics:
+            if metric.command.startswith(prefix) and metric.success:
+                grouped.setdefault(metric.command[len(prefix):], []).append(metric.execution_time)
+
+        stats = {}
+        for command, times in grouped.items():
+            times.sort()
+            stats[command] = {
+                "count": len(times),
+                "average_time": round(sum(times) / len(times), 3),
+                "p95_time": round(times[min(int(len(times) * 0.95), len(times) - 1)], 3)
+            }
+        return stats
+
     def _cleanup_old_metrics(self):
         """Очищает старые метрики"""
         try:
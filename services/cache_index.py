@@ -0,0 +1,126 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable
+from utils.logger import logger
+
+class CacheIndex:
+    """Индекс метаданных кэша в SQLite.
+
+    Создание, изменение и удаление записей сохраняются сразу, каждое - одной
+    транзакцией (в журнале WAL запись не повреждается при падении процесса).
+    Статистика обращений (last_accessed, access_count) копится в памяти
+    и сбрасывается одной транзакцией не чаще раза в flush_interval секунд.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, metadata TEXT NOT NULL)")
+        self._conn.commit()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Все записи индекса"""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, metadata FROM entries").fetchall()
+
+        entries = {}
+        for key, metadata in rows:
+            try:
+                entries[key] = json.loads(metadata)
+            except ValueError as e:
+                logger.error(f"Skipping corrupted cache index entry {key}: {e}")
+        return entries
+
+    def import_json(self, json_path: str) -> int:
+        """Перенос метаданных из прежнего cache_metadata.json (файл удаляется после переноса)"""
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, 'r') as f:
+                entries = json.load(f)
+            self.put_many(entries)
+            os.remove(json_path)
+            logger.info(f"Migrated {len(entries)} cache entries from {json_path}")
+            return len(entries)
+        except Exception as e:
+            logger.error(f"Error migrating cache metadata from {json_path}: {e}")
+            return 0
+
+    def put(self, key: str, metadata: Dict[str, Any]):
+        """Сохранение записи"""
+        self.put_many({key: metadata})
+
+    def put_many(self, entries: Dict[str, Dict[str, Any]]):
+        """Сохранение нескольких записей одной транзакцией"""
+        if not entries:
+            return
+        rows = [(key, json.dumps(metadata)) for key, metadata in entries.items()]
+        with self._lock:
+            for key in entries:
+                self._dirty.pop(key, None)
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO entries (key, metadata) VALUES (?, ?)", rows)
+
+    def touch(self, key: str, metadata: Dict[str, Any]):
+        """Отложенное сохранение статистики обращений"""
+        with self._lock:
+            self._dirty[key] = metadata
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def delete(self, keys: Iterable[str]):
+        """Удаление записей одной транзакцией"""
+        keys = [(key,) for key in keys]
+        if not keys:
+            return
+        with self._lock:
+            for (key,) in keys:
+                self._dirty.pop(key, None)
+            with self._conn:
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+
+    def clear(self):
+        """Удаление всех записей"""
+        with self._lock:
+            self._dirty.clear()
+            with self._conn:
+                self._conn.execute("DELETE FROM entries")
+
+    def flush(self):
+        """Сброс накопленной статистики обращений"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            rows = [(json.dumps(metadata), key) for key, metadata in dirty.items()]
+            try:
+                with self._conn:
+                    # Только существующие записи: удалённые после обращения не воскрешаем
+                    self._conn.executemany("UPDATE entries SET metadata = ? WHERE key = ?", rows)
+                self.flushes += 1
+            except sqlite3.Error as e:
+                logger.error(f"Error flushing cache index: {e}")
+
+    def close(self):
+        """Сброс статистики и закрытие базы"""
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    @property
+    def pending(self) -> int:
+        """Число записей с несохранённой статистикой"""
+        return len(self._dirty)
@@ -1,169 +1,573 @@
 import os
+import asyncio
+import functools
 import hashlib
 import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, Tuple, List
 from utils.logger import logger
+from services.cache_index import CacheIndex
+from services.cache_policies import create_policy
+from services.worker_pool import WorkerPool
 import shutil
 
+# Результаты поиска в кэше
+CACHE_FRESH = 'fresh'  # запись моложе мягкого TTL
+CACHE_STALE = 'stale'  # запись между мягким и жёстким TTL: отдаётся, но требует обновления
+CACHE_MISS = 'miss'    # записи нет или она старше жёсткого TTL
+
+def is_full_screenshot(params: Dict[str, Any]) -> bool:
+    """Запись - полный скриншот дашборда, а не область или результат обработки"""
+    return 'region' not in params and 'source_id' not in params
+
+@dataclass
+class CacheLookup:
+    """Результат поиска скриншота в кэше"""
+    data: Optional[bytes]
+    status: str = CACHE_MISS
+    tier: Optional[str] = None  # 'memory' или 'disk'
+
+def _locked(method):
+    """Выполнение метода CacheManager под его блокировкой"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class MemoryCache:
+    """Ограниченный по объёму в байтах LRU-кэш в памяти процесса"""
+
+    def __init__(self, max_size_mb: int = 64):
+        self.max_bytes = max_size_mb * 1024 * 1024
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """Возвращает (данные, время создания) и помечает запись как недавно использованную"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, data: bytes, created_at: float):
+        """Добавляет запись, вытесняя самые давние при превышении лимита"""
+        if len(data) > self.max_bytes:
+            return
+
+        self.remove(key)
+        self._entries[key] = (data, created_at)
+        self.current_bytes += len(data)
+
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+
+    def remove(self, key: str):
+        """Удаляет запись из памяти"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= len(entry[0])
+
+    def clear(self):
+        """Полная очистка"""
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
 class CacheManager:
-    def __init__(self, cache_dir: str = "cache", max_size_mb: int = 500):
+    def __init__(self, cache_dir: str = "cache", max_size_mb: int = 500,
+                 memory_max_mb: int = 64, ttl_seconds: int = 3600,
+                 fingerprint_ttl_seconds: int = 86400, soft_ttl_seconds: Optional[int] = None,
+                 index_flush_interval: float = 5.0, eviction_policy: str = 'lru',
+                 io_workers: int = 4):
         self.cache_dir = cache_dir
         self.max_size_mb = max_size_mb
+        # Жёсткий TTL: после него запись считается промахом
+        self.ttl_seconds = ttl_seconds
+        # Мягкий TTL: после него запись отдаётся как устаревшая и обновляется в фоне
+        self.soft_ttl_seconds = soft_ttl_seconds if soft_ttl_seconds is not None else ttl_seconds
+        # Записи с отпечатком данных остаются валидными, пока отпечаток не изменится
+        self.fingerprint_ttl_seconds = fingerprint_ttl_seconds
         self.cache_hits = 0
         self.cache_misses = 0
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
         self.bytes_saved = 0
-        self._metadata_file = os.path.join(cache_dir, "cache_metadata.json")
+        self._memory = MemoryCache(memory_max_mb)
         self._metadata: Dict[str, Dict[str, Any]] = {}
 
+        # Синхронный API можно вызывать из любых потоков. Асинхронный выполняет
+        # дисковые операции в отдельном пуле и объединяет одновременные чтения ключа
+        self._lock = threading.RLock()
+        self._io = WorkerPool(max_workers=io_workers, name="cache-io")
+        self._reads: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.coalesced_reads = 0
+
         # Создаем директорию и загружаем метаданные
         os.makedirs(cache_dir, exist_ok=True)
+        # Имя с точкой: файлы индекса не считаются файлами кэша при очистке
+        self._index = CacheIndex(os.path.join(cache_dir, ".cache_index.db"), flush_interval=index_flush_interval)
         self._load_metadata()
 
+        # Размер кэша учитывается по мере записи и удаления, порядок вытеснения - политикой
+        self._policy = create_policy(eviction_policy)
+        self.current_bytes = 0  # место на диске
+        self.logical_bytes = 0  # сумма размеров записей до дедупликации
+        self._blobs: Dict[str, int] = {}  # sha256 содержимого -> число ссылающихся записей
+        self.evictions = 0
+        self._rebuild_accounting()
+
     def _load_metadata(self):
-        """Загрузка метаданных кэша из файла"""
+        """Загрузка метаданных кэша из индекса (с переносом прежнего JSON-файла)"""
         try:
-            if os.path.exists(self._metadata_file):
-                with open(self._metadata_file, 'r') as f:
-                    self._metadata = json.load(f)
+            self._index.import_json(os.path.join(self.cache_dir, "cache_metadata.json"))
+            self._metadata = self._index.load()
         except Exception as e:
             logger.error(f"Error loading cache metadata: {e}")
             self._metadata = {}
 
-    def _save_metadata(self):
-        """Сохранение метаданных кэша"""
+    def _rebuild_accounting(self):
+        """Сверка индекса с файлами и заполнение политики вытеснения (один раз при запуске)"""
         try:
-            with open(self._metadata_file, 'w') as f:
-                json.dump(self._metadata, f, indent=2)
-        except Exception as e:
-            logger.error(f"Error saving cache metadata: {e}")
+            files = {
+                filename for filename in os.listdir(self.cache_dir)
+                if not filename.startswith('.') and filename != "cache_metadata.json"
+            }
+        except OSError as e:
+            logger.error(f"Error scanning cache directory: {e}")
+            files = set()
+
+        # Файлы прежнего формата ({ключ}.{формат}) переносим в хранилище по содержимому
+        migrated = {}
+        for cache_key, metadata in self._metadata.items():
+            legacy = f"{cache_key}.{metadata.get('format', '')}"
+            if 'blob' in metadata or legacy not in files:
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, legacy), 'rb') as f:
+                    digest = self._blob_digest(f.read())
+                blob = os.path.basename(self._get_blob_path(digest))
+                if blob in files:
+                    os.remove(os.path.join(self.cache_dir, legacy))
+                else:
+                    os.replace(os.path.join(self.cache_dir, legacy), self._get_blob_path(digest))
+                    files.add(blob)
+                files.discard(legacy)
+                metadata['blob'] = digest
+                migrated[cache_key] = metadata
+            except OSError as e:
+                logger.error(f"Error migrating cache file {legacy}: {e}")
+        self._index.put_many(migrated)
+
+        # Записи без файла недоступны, файлы без записи не найти по ключу
+        missing = [
+            cache_key for cache_key, metadata in self._metadata.items()
+            if 'blob' not in metadata or os.path.basename(self._get_blob_path(metadata['blob'])) not in files
+        ]
+        for cache_key in missing:
+            del self._metadata[cache_key]
+        self._index.delete(missing)
+
+        known = {os.path.basename(self._get_blob_path(metadata['blob'])) for metadata in self._metadata.values()}
+        for filename in files - known:
+            try:
+                os.remove(os.path.join(self.cache_dir, filename))
+            except OSError as e:
+                logger.error(f"Error removing orphaned cache file {filename}: {e}")
+
+        by_recency = sorted(
+            self._metadata.items(),
+            key=lambda item: item[1].get('last_accessed', item[1].get('created_at', 0))
+        )
+        for cache_key, metadata in by_recency:
+            self._policy.add(cache_key, metadata.get('size', 0), metadata.get('access_count', 0))
+            self._add_reference(metadata)
+
+        if migrated or missing or files - known:
+            logger.info(
+                f"Cache reconciled: {len(migrated)} files migrated to content storage, "
+                f"{len(missing)} stale index entries, {len(files - known)} orphaned files"
+            )
+        self._index.delete(self._evict(0))
+
+    @_locked
+    def flush(self):
+        """Сброс накопленной статистики обращений в индекс"""
+        self._index.flush()
+
+    def close(self):
+        """Остановка пула ввода-вывода, сохранение статистики и закрытие индекса"""
+        self._io.shutdown()
+        with self._lock:
+            self._index.close()
+
+    def _versioned_params(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Параметры с версией данных: отпечатком таблицы или часовым интервалом"""
+        params_with_version = dict(params)
+        # Записи из неизменяемого источника (source_id) от времени не зависят
+        if 'data_fingerprint' not in params and 'source_id' not in params:
+            # Без отпечатка данных версионируем по времени с точностью до часа
+            params_with_version.setdefault('cache_hour', datetime.now().strftime('%Y%m%d%H'))
+        return params_with_version
 
     def _generate_cache_key(self, params: Dict[str, Any]) -> str:
         """Генерация уникального ключа кэша на основе параметров"""
-        # Добавляем временную метку с точностью до часа для версионирования
-        params_with_time = dict(params)
-        params_with_time['cache_hour'] = datetime.now().strftime('%Y%m%d%H')
-        param_str = json.dumps(params_with_time, sort_keys=True)
+        param_str = json.dumps(self._versioned_params(params), sort_keys=True)
         return hashlib.sha256(param_str.encode()).hexdigest()
 
-    def _get_cache_path(self, cache_key: str, format: str) -> str:
-        """Получение полного пути для кэшированного скриншота"""
-        return os.path.join(self.cache_dir, f"{cache_key}.{format}")
-
-    def _check_and_clean_cache(self):
-        """Проверка размера кэша и удаление старых файлов при необходимости"""
+    def _default_ttls(self, params: Dict[str, Any]) -> Tuple[int, int]:
+        """Мягкий и жёсткий TTL в зависимости от способа валидации"""
+        if 'data_fingerprint' in params:
+            # Окно устаревания то же, но отсчитывается от срока жизни отпечатка
+            grace = self.ttl_seconds - self.soft_ttl_seconds
+            return self.fingerprint_ttl_seconds, self.fingerprint_ttl_seconds + grace
+        return self.soft_ttl_seconds, self.ttl_seconds
+
+    def _entry_ttls(self, cache_key: str, params: Dict[str, Any]) -> Tuple[int, int]:
+        """Мягкий и жёсткий TTL конкретной записи"""
+        soft_ttl, hard_ttl = self._default_ttls(params)
+        metadata = self._metadata.get(cache_key, {})
+        return metadata.get('soft_ttl', soft_ttl), metadata.get('hard_ttl', hard_ttl)
+
+    def _record_hit(self, cache_key: str, data: bytes, status: str, tier: str, now: float):
+        """Учёт попадания в кэш"""
+        self.cache_hits += 1
+        self.bytes_saved += len(data)
+        if tier == 'memory':
+            self.memory_hits += 1
+        else:
+            self.disk_hits += 1
+        if status == CACHE_STALE:
+            self.stale_hits += 1
+        else:
+            self.fresh_hits += 1
+
+        metadata = self._metadata.get(cache_key)
+        if metadata is not None:
+            metadata['last_accessed'] = now
+            metadata['access_count'] = metadata.get('access_count', 0) + 1
+            self._index.touch(cache_key, metadata)
+            self._policy.touch(cache_key)
+
+    @staticmethod
+    def _blob_digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _get_blob_path(self, digest: str) -> str:
+        """Путь к файлу содержимого: одинаковые изображения хранятся одним файлом"""
+        return os.path.join(self.cache_dir, f"{digest}.blob")
+
+    def _add_reference(self, metadata: Dict[str, Any]) -> bool:
+        """Учёт ссылки записи на файл содержимого
+
+        Returns:
+            True, если это первая ссылка (файл занимает место на диске)
+        """
+        digest = metadata['blob']
+        size = metadata.get('size', 0)
+        refs = self._blobs.get(digest, 0)
+        self._blobs[digest] = refs + 1
+        self.logical_bytes += size
+        if refs == 0:
+            self.current_bytes += size
+        return refs == 0
+
+    def _write_atomic(self, path: str, data: bytes):
+        """Запись через временный файл: при сбое не остаётся обрезанного файла кэша"""
+        # Свой временный файл у каждого потока: одно содержимое могут записывать одновременно
+        temp_path = os.path.join(self.cache_dir, f".{os.path.basename(path)}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _remove_entry(self, cache_key: str) -> int:
+        """Удаление записи (индекс обновляет вызывающий)
+
+        Returns:
+            Освобождённое на диске место в байтах
+        """
+        metadata = self._metadata.pop(cache_key, None)
+        if metadata is None:
+            return 0
+        self._policy.remove(cache_key)
+        return self._release_reference(metadata)
+
+    def _release_reference(self, metadata: Dict[str, Any]) -> int:
+        """Снятие ссылки записи; файл содержимого удаляется вместе с последней ссылкой на него
+
+        Returns:
+            Освобождённое на диске место в байтах
+        """
+        size = metadata.get('size', 0)
+        self.logical_bytes -= size
+        digest = metadata.get('blob')
+        refs = self._blobs.get(digest, 0) - 1
+        if refs > 0:
+            self._blobs[digest] = refs
+            return 0
+
+        self._blobs.pop(digest, None)
+        self._memory.remove(digest)
+        self.current_bytes -= size
         try:
-            total_size = 0
-            cache_files = []
-
-            # Собираем информацию о файлах кэша
-            for filename in os.listdir(self.cache_dir):
-                if filename.startswith('.') or filename == "cache_metadata.json":
-                    continue
-
-                file_path = os.path.join(self.cache_dir, filename)
-                stats = os.stat(file_path)
-                cache_files.append({
-                    'path': file_path,
-                    'size': stats.st_size,
-                    'mtime': stats.st_mtime
-                })
-                total_size += stats.st_size
-
-            # Если размер кэша превышает лимит, удаляем старые файлы
-            if total_size > self.max_size_mb * 1024 * 1024:
-                # Сортируем файлы по времени последнего доступа
-                cache_files.sort(key=lambda x: x['mtime'])
-
-                # Удаляем старые файлы, пока размер не станет приемлемым
-                for file_info in cache_files:
-                    if total_size <= self.max_size_mb * 1024 * 1024:
-                        break
-
-                    try:
-                        os.remove(file_info['path'])
-                        total_size -= file_info['size']
-                        # Удаляем метаданные
-                        key = os.path.splitext(os.path.basename(file_info['path']))[0]
-                        if key in self._metadata:
-                            del self._metadata[key]
-                    except Exception as e:
-                        logger.error(f"Error removing cache file: {e}")
-
-                self._save_metadata()
-
-        except Exception as e:
-            logger.error(f"Error in cache cleanup: {e}")
-
-    def get_cached_screenshot(self, params: Dict[str, Any], format: str) -> Optional[bytes]:
-        """Получение кэшированного скриншота с проверкой валидности"""
+            os.remove(self._get_blob_path(digest))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing cache file: {e}")
+        return size
+
+    def _evict(self, incoming: int) -> List[str]:
+        """Вытеснение записей по политике, пока новые incoming байт не поместятся в лимит
+
+        Returns:
+            Ключи вытесненных записей
+        """
+        limit = self.max_size_mb * 1024 * 1024
+        evicted = []
+        while self.current_bytes + incoming > limit:
+            cache_key = self._policy.victim()
+            if cache_key is None:
+                break
+            self._remove_entry(cache_key)
+            evicted.append(cache_key)
+
+        if evicted:
+            self.evictions += len(evicted)
+            logger.info(f"Evicted {len(evicted)} cache entries ({self._policy.name})")
+        return evicted
+
+    def lookup_screenshot(self, params: Dict[str, Any], format: str) -> CacheLookup:
+        """Поиск скриншота в кэше: сначала в памяти, затем на диске.
+
+        Returns:
+            CacheLookup: данные, статус ('fresh', 'stale' или 'miss') и уровень кэша
+        """
         cache_key = self._generate_cache_key(params)
-        cache_path = self._get_cache_path(cache_key, format)
+        now = datetime.now().timestamp()
 
-        try:
-            if not os.path.exists(cache_path):
+        with self._lock:
+            soft_ttl, hard_ttl = self._entry_ttls(cache_key, params)
+            metadata = self._metadata.get(cache_key)
+            if metadata is None or metadata.get('format') != format:
                 self.cache_misses += 1
-                return None
-
-            # Проверяем метаданные и валидность кэша
-            metadata = self._metadata.get(cache_key, {})
-            cache_time = metadata.get('created_at', 0)
-
-            # Проверяем срок действия кэша (1 час)
-            if datetime.now().timestamp() - cache_time > 3600:
-                os.remove(cache_path)
-                if cache_key in self._metadata:
-                    del self._metadata[cache_key]
-                self._save_metadata()
+                return CacheLookup(data=None)
+
+            # После жёсткого TTL запись считается промахом. Файл остаётся до вытеснения
+            # или перезаписи: он нужен как резервная копия при недоступности APIFlash
+            age = now - metadata.get('created_at', 0)
+            if age > hard_ttl:
                 self.cache_misses += 1
-                return None
+                return CacheLookup(data=None)
+            status = CACHE_FRESH if age <= soft_ttl else CACHE_STALE
 
-            # Чтение файла
-            with open(cache_path, 'rb') as f:
+            # Горячий уровень в памяти (по содержимому: одинаковые изображения хранятся один раз)
+            digest = metadata['blob']
+            entry = self._memory.get(digest)
+            if entry is not None:
+                self._record_hit(cache_key, entry[0], status, 'memory', now)
+                return CacheLookup(data=entry[0], status=status, tier='memory')
+
+        # Файл содержимого не меняется после записи, поэтому читается без блокировки
+        try:
+            with open(self._get_blob_path(digest), 'rb') as f:
                 data = f.read()
-                self.cache_hits += 1
-                self.bytes_saved += len(data)
+        except Exception as e:
+            logger.error(f"Cache read error: {str(e)}")
+            with self._lock:
+                self.cache_misses += 1
+            return CacheLookup(data=None)
 
-                # Обновляем статистику использования
-                metadata['last_accessed'] = datetime.now().timestamp()
-                metadata['access_count'] = metadata.get('access_count', 0) + 1
-                self._save_metadata()
+        with self._lock:
+            self._record_hit(cache_key, data, status, 'disk', now)
+            # Поднимаем запись в память для последующих запросов, если её не вытеснили во время чтения
+            if digest in self._blobs:
+                self._memory.put(digest, data, metadata.get('created_at', 0))
+        return CacheLookup(data=data, status=status, tier='disk')
 
-                return data
+    def get_cached_screenshot(self, params: Dict[str, Any], format: str) -> Optional[bytes]:
+        """Получение кэшированного скриншота с проверкой валидности"""
+        return self.lookup_screenshot(params, format).data
 
-        except Exception as e:
-            logger.error(f"Cache read error: {str(e)}")
-            self.cache_misses += 1
-            return None
+    @_locked
+    def get_entry_attributes(self, params: Dict[str, Any], record_hit: bool = False) -> Dict[str, Any]:
+        """Дополнительные атрибуты действующей записи (пусто, если записи нет или она истекла)
 
-    def cache_screenshot(self, params: Dict[str, Any], format: str, screenshot_data: bytes) -> None:
-        """Сохранение скриншота в кэш с метаданными"""
+        Args:
+            record_hit: Учесть обращение как попадание в кэш (данные при этом не читаются)
+        """
+        cache_key = self._generate_cache_key(params)
+        metadata = self._metadata.get(cache_key)
+        if metadata is None:
+            return {}
+
+        now = datetime.now().timestamp()
+        _, hard_ttl = self._entry_ttls(cache_key, params)
+        if now - metadata.get('created_at', 0) > hard_ttl:
+            return {}
+
+        attributes = metadata.get('attributes', {})
+        if record_hit and attributes:
+            self.cache_hits += 1
+            self.fresh_hits += 1
+            self.bytes_saved += metadata.get('size', 0)
+            metadata['last_accessed'] = now
+            metadata['access_count'] = metadata.get('access_count', 0) + 1
+            self._index.touch(cache_key, metadata)
+            self._policy.touch(cache_key)
+        return dict(attributes)
+
+    @_locked
+    def set_entry_attribute(self, params: Dict[str, Any], name: str, value: Any) -> bool:
+        """Сохранение атрибута существующей записи (например, file_id отправленного файла)"""
+        cache_key = self._generate_cache_key(params)
+        metadata = self._metadata.get(cache_key)
+        if metadata is None:
+            return False
+
+        attributes = metadata.setdefault('attributes', {})
+        if value is None:
+            attributes.pop(name, None)
+        else:
+            attributes[name] = value
+        self._index.put(cache_key, metadata)
+        return True
+
+    def cache_screenshot(self, params: Dict[str, Any], format: str, screenshot_data: bytes,
+                         soft_ttl: Optional[int] = None, hard_ttl: Optional[int] = None) -> None:
+        """Сохранение скриншота в кэш с метаданными
+
+        Args:
+            soft_ttl: Мягкий TTL записи (по умолчанию - из настроек кэша)
+            hard_ttl: Жёсткий TTL записи (по умолчанию - из настроек кэша)
+        """
         try:
-            # Проверяем и очищаем кэш при необходимости
-            self._check_and_clean_cache()
-
             cache_key = self._generate_cache_key(params)
-            cache_path = self._get_cache_path(cache_key, format)
+            digest = self._blob_digest(screenshot_data)
+            blob_path = self._get_blob_path(digest)
 
-            # Сохраняем файл
-            with open(cache_path, 'wb') as f:
-                f.write(screenshot_data)
+            # Файл пишется без блокировки: одинаковое содержимое даёт одинаковый файл
+            if not os.path.exists(blob_path):
+                self._write_atomic(blob_path, screenshot_data)
 
-            # Обновляем метаданные
-            self._metadata[cache_key] = {
-                'created_at': datetime.now().timestamp(),
+            created_at = datetime.now().timestamp()
+            default_soft, default_hard = self._default_ttls(params)
+            metadata = {
+                'created_at': created_at,
                 'format': format,
                 'size': len(screenshot_data),
-                'params': params,
-                'access_count': 0
+                'blob': digest,
+                'params': self._versioned_params(params),
+                'access_count': 0,
+                'soft_ttl': soft_ttl if soft_ttl is not None else default_soft,
+                'hard_ttl': hard_ttl if hard_ttl is not None else default_hard
             }
 
-            self._save_metadata()
+            with self._lock:
+                # Файл могли удалить вытеснением или очисткой, пока на него никто не ссылался
+                if digest not in self._blobs and not os.path.exists(blob_path):
+                    self._write_atomic(blob_path, screenshot_data)
+
+                # Ссылка на новое содержимое учитывается до снятия ссылки прежней версии,
+                # чтобы перезапись тем же содержимым не удаляла общий файл
+                if not self._add_reference(metadata):
+                    logger.info(f"Screenshot content deduplicated: {digest[:12]}")
+                previous = self._metadata.pop(cache_key, None)
+                if previous is not None:
+                    self._policy.remove(cache_key)
+                    self._release_reference(previous)
+
+                # Новая запись добавляется в политику после вытеснения и сама не вытесняется
+                evicted = self._evict(0)
+                self._metadata[cache_key] = metadata
+                self._policy.add(cache_key, len(screenshot_data))
+                self._memory.put(digest, screenshot_data, created_at)
+                self._index.put(cache_key, metadata)
+                self._index.delete(evicted)
             logger.info(f"Screenshot cached successfully: {cache_key}")
 
         except Exception as e:
             logger.error(f"Error caching screenshot: {str(e)}")
 
+    def get_latest_screenshot(self, format: str) -> Optional[bytes]:
+        """Самая свежая сохранённая копия полного скриншота в формате без учёта срока действия"""
+        with self._lock:
+            candidates = sorted(
+                ((metadata.get('created_at', 0), self._get_blob_path(metadata['blob']))
+                 for metadata in self._metadata.values()
+                 if metadata.get('format') == format
+                 and is_full_screenshot(metadata.get('params', {}))),
+                reverse=True
+            )
+
+        for _, cache_path in candidates:
+            try:
+                if os.path.exists(cache_path):
+                    with open(cache_path, 'rb') as f:
+                        return f.read()
+            except Exception as e:
+                logger.error(f"Cache read error: {str(e)}")
+        return None
+
+    @_locked
+    def get_expiring_entries(self, within_seconds: float) -> List[Dict[str, Any]]:
+        """Записи, которые в ближайшие within_seconds секунд перестанут быть свежими"""
+        now = datetime.now().timestamp()
+        expiring = []
+
+        for cache_key, metadata in self._metadata.items():
+            params = metadata.get('params', {})
+            soft_ttl, _ = self._entry_ttls(cache_key, params)
+            expires_at = metadata.get('created_at', 0) + soft_ttl
+
+            # Запись с часовой версией перестаёт находиться по ключу в начале следующего часа
+            cache_hour = params.get('cache_hour')
+            if cache_hour:
+                hour_end = datetime.strptime(cache_hour, '%Y%m%d%H') + timedelta(hours=1)
+                expires_at = min(expires_at, hour_end.timestamp())
+
+            if now <= expires_at <= now + within_seconds:
+                expiring.append({
+                    'key': cache_key,
+                    'format': metadata.get('format'),
+                    'params': params,
+                    'expires_at': expires_at,
+                    'access_count': metadata.get('access_count', 0)
+                })
+
+        return expiring
+
+    @_locked
+    def invalidate_fingerprint(self, current_fingerprint: str) -> int:
+        """Удаление записей, построенных по устаревшему отпечатку данных"""
+        removed_keys = []
+        try:
+            for cache_key, metadata in list(self._metadata.items()):
+                fingerprint = metadata.get('params', {}).get('data_fingerprint')
+                if fingerprint is None or fingerprint == current_fingerprint:
+                    continue
+
+                self._remove_entry(cache_key)
+                removed_keys.append(cache_key)
+
+            if removed_keys:
+                logger.info(f"Invalidated {len(removed_keys)} cache entries after data change")
+
+        except Exception as e:
+            logger.error(f"Error invalidating cache by fingerprint: {str(e)}")
+
+        self._index.delete(removed_keys)
+        return len(removed_keys)
+
+    @_locked
     def clear_cache(self) -> Tuple[int, int]:
         """Очистка всего кэша с возвратом статистики"""
         try:
@@ -183,14 +587,24 @@ class CacheManager:
                 except Exception as e:
                     logger.error(f"Error removing cache file {filename}: {str(e)}")
 
-            # Очищаем метаданные
+            # Очищаем метаданные и кэш в памяти
             self._metadata = {}
-            self._save_metadata()
+            self._index.clear()
+            self._memory.clear()
+            self._policy = create_policy(self._policy.name)
+            self._blobs = {}
+            self.current_bytes = 0
+            self.logical_bytes = 0
 
             # Сбрасываем статистику
             self.cache_hits = 0
             self.cache_misses = 0
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.fresh_hits = 0
+            self.stale_hits = 0
             self.bytes_saved = 0
+            self.evictions = 0
 
             return files_cleared, bytes_cleared
 
@@ -198,24 +612,93 @@ class CacheManager:
             logger.error(f"Error clearing cache: {str(e)}")
             return 0, 0
 
+    async def alookup(self, params: Dict[str, Any], format: str) -> CacheLookup:
+        """Поиск в кэше без блокировки event loop: чтение выполняется в пуле ввода-вывода.
+
+        Одновременные запросы одного ключа ожидают одно и то же чтение.
+        """
+        key = (self._generate_cache_key(params), format)
+        pending = self._reads.get(key)
+        if pending is not None:
+            self.coalesced_reads += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.ensure_future(self._io.run(self.lookup_screenshot, params, format))
+        self._reads[key] = future
+        future.add_done_callback(lambda _: self._reads.pop(key, None))
+        # Отмена одного ожидающего не прерывает чтение для остальных
+        return await asyncio.shield(future)
+
+    async def aget(self, params: Dict[str, Any], format: str) -> Optional[bytes]:
+        """Асинхронный get_cached_screenshot"""
+        return (await self.alookup(params, format)).data
+
+    async def aput(self, params: Dict[str, Any], format: str, screenshot_data: bytes,
+                   soft_ttl: Optional[int] = None, hard_ttl: Optional[int] = None) -> None:
+        """Асинхронный cache_screenshot"""
+        await self._io.run(self.cache_screenshot, params, format, screenshot_data, soft_ttl, hard_ttl)
+
+    async def aget_latest_screenshot(self, format: str) -> Optional[bytes]:
+        """Асинхронный get_latest_screenshot"""
+        return await self._io.run(self.get_latest_screenshot, format)
+
+    async def aget_entry_attributes(self, params: Dict[str, Any], record_hit: bool = False) -> Dict[str, Any]:
+        """Асинхронный get_entry_attributes (учёт обращения может сбросить индекс)"""
+        return await self._io.run(self.get_entry_attributes, params, record_hit)
+
+    async def aset_entry_attribute(self, params: Dict[str, Any], name: str, value: Any) -> bool:
+        """Асинхронный set_entry_attribute"""
+        return await self._io.run(self.set_entry_attribute, params, name, value)
+
+    async def ainvalidate_fingerprint(self, current_fingerprint: str) -> int:
+        """Асинхронный invalidate_fingerprint"""
+        return await self._io.run(self.invalidate_fingerprint, current_fingerprint)
+
+    async def aget_expiring_entries(self, within_seconds: float) -> List[Dict[str, Any]]:
+        """Асинхронный get_expiring_entries"""
+        return await self._io.run(self.get_expiring_entries, within_seconds)
+
+    async def aclear(self) -> Tuple[int, int]:
+        """Асинхронный clear_cache"""
+        return await self._io.run(self.clear_cache)
+
+    async def aflush(self):
+        """Асинхронный flush"""
+        await self._io.run(self.flush)
+
+    @_locked
     def get_stats(self) -> Dict[str, Any]:
         """Получение расширенной статистики использования кэша"""
         total_requests = self.cache_hits + self.cache_misses
         hit_rate = (self.cache_hits / total_requests * 100) if total_requests > 0 else 0
 
-        # Подсчет общего размера кэша
-        total_cache_size = sum(
-            metadata.get('size', 0) 
-            for metadata in self._metadata.values()
-        )
+        total_cache_size = self.current_bytes
 
         return {
             "cache_hits": self.cache_hits,
             "cache_misses": self.cache_misses,
             "hit_rate": round(hit_rate, 2),
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "memory": {
+                "hits": self.memory_hits,
+                "misses": total_requests - self.memory_hits,
+                "entries": len(self._memory),
+                "size_mb": round(self._memory.current_bytes / (1024 * 1024), 2)
+            },
+            "disk": {
+                "hits": self.disk_hits,
+                "misses": self.cache_misses
+            },
             "bytes_saved": self.bytes_saved,
             "mb_saved": round(self.bytes_saved / (1024 * 1024), 2),
             "total_cache_size_mb": round(total_cache_size / (1024 * 1024), 2),
             "cache_entries": len(self._metadata),
+            "blobs": len(self._blobs),
+            "dedup_ratio": round(self.logical_bytes / self.current_bytes, 2) if self.current_bytes else 1.0,
+            "eviction_policy": self._policy.name,
+            "evictions": self.evictions,
+            "coalesced_reads": self.coalesced_reads,
+            "io_pool": self._io.get_stats(),
             "cache_utilization": round((total_cache_size / (self.max_size_mb * 1024 * 1024)) * 100, 2)
         }
\ No newline at end of file
@@ -0,0 +1,181 @@
+import heapq
+import itertools
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+class EvictionPolicy(ABC):
+    """Порядок вытеснения записей дискового кэша"""
+
+    name: str = ''
+
+    @abstractmethod
+    def add(self, key: str, size: int, access_count: int = 0):
+        """Новая запись (или перезапись существующей)"""
+
+    @abstractmethod
+    def touch(self, key: str):
+        """Обращение к записи"""
+
+    @abstractmethod
+    def remove(self, key: str):
+        """Запись удалена не вытеснением"""
+
+    @abstractmethod
+    def victim(self) -> Optional[str]:
+        """Извлекает ключ записи, которую следует вытеснить первой"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+class LRUPolicy(EvictionPolicy):
+    """Вытеснение давно не использованных записей, O(1) на операцию"""
+
+    name = 'lru'
+
+    def __init__(self):
+        self._order: "OrderedDict[str, None]" = OrderedDict()
+
+    def add(self, key: str, size: int, access_count: int = 0):
+        self._order[key] = None
+        self._order.move_to_end(key)
+
+    def touch(self, key: str):
+        if key in self._order:
+            self._order.move_to_end(key)
+
+    def remove(self, key: str):
+        self._order.pop(key, None)
+
+    def victim(self) -> Optional[str]:
+        if not self._order:
+            return None
+        key, _ = self._order.popitem(last=False)
+        return key
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+class _HeapPolicy(EvictionPolicy):
+    """Вытеснение записи с наименьшим приоритетом.
+
+    Куча с ленивым удалением: при изменении приоритета добавляется новый
+    элемент, устаревшие пропускаются при извлечении. Куча перестраивается,
+    когда устаревших элементов становится больше живых.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str]] = []
+        self._entries: Dict[str, Tuple[float, int]] = {}  # ключ -> (приоритет, номер элемента)
+        self._counter = itertools.count()
+
+    @abstractmethod
+    def _priority(self, key: str) -> float:
+        """Приоритет записи: первой вытесняется запись с наименьшим"""
+
+    def _push(self, key: str):
+        item = (self._priority(key), next(self._counter))
+        self._entries[key] = item
+        heapq.heappush(self._heap, (*item, key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(*item, k) for k, item in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def _pop(self) -> Optional[Tuple[float, str]]:
+        while self._heap:
+            priority, seq, key = heapq.heappop(self._heap)
+            if self._entries.get(key) == (priority, seq):
+                del self._entries[key]
+                return priority, key
+        return None
+
+    def remove(self, key: str):
+        self._entries.pop(key, None)
+
+    def victim(self) -> Optional[str]:
+        popped = self._pop()
+        return popped[1] if popped else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class LFUPolicy(_HeapPolicy):
+    """Вытеснение редко используемых записей (при равенстве - более давних)"""
+
+    name = 'lfu'
+
+    def __init__(self):
+        super().__init__()
+        self._counts: Dict[str, int] = {}
+
+    def _priority(self, key: str) -> float:
+        return self._counts[key]
+
+    def add(self, key: str, size: int, access_count: int = 0):
+        self._counts[key] = access_count
+        self._push(key)
+
+    def touch(self, key: str):
+        if key in self._entries:
+            self._counts[key] += 1
+            self._push(key)
+
+    def remove(self, key: str):
+        super().remove(key)
+        self._counts.pop(key, None)
+
+    def victim(self) -> Optional[str]:
+        key = super().victim()
+        if key is not None:
+            del self._counts[key]
+        return key
+
+class GDSFPolicy(_HeapPolicy):
+    """Greedy-Dual-Size-Frequency: приоритет L + частота / размер.
+
+    Крупные редко используемые записи вытесняются первыми. L - приоритет
+    последней вытесненной записи, поэтому давно не использованные записи
+    со временем уступают новым независимо от прежней частоты.
+    """
+
+    name = 'gdsf'
+
+    def __init__(self):
+        super().__init__()
+        self._inflation = 0.0
+        self._stats: Dict[str, Tuple[int, int]] = {}  # ключ -> (частота, размер)
+
+    def _priority(self, key: str) -> float:
+        frequency, size = self._stats[key]
+        return self._inflation + frequency / max(size, 1)
+
+    def add(self, key: str, size: int, access_count: int = 0):
+        self._stats[key] = (access_count + 1, size)
+        self._push(key)
+
+    def touch(self, key: str):
+        if key in self._entries:
+            frequency, size = self._stats[key]
+            self._stats[key] = (frequency + 1, size)
+            self._push(key)
+
+    def remove(self, key: str):
+        super().remove(key)
+        self._stats.pop(key, None)
+
+    def victim(self) -> Optional[str]:
+        popped = self._pop()
+        if popped is None:
+            return None
+        self._inflation, key = popped
+        del self._stats[key]
+        return key
+
+EVICTION_POLICIES = {policy.name: policy for policy in (LRUPolicy, LFUPolicy, GDSFPolicy)}
+
+def create_policy(name: str) -> EvictionPolicy:
+    """Политика вытеснения по имени из настроек"""
+    if name not in EVICTION_POLICIES:
+        raise ValueError(f"Unknown cache eviction policy: {name}")
+    return EVICTION_POLICIES[name]()
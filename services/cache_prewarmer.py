@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from utils.logger import logger
+from services.apiflash_scheduler import Priority
+from services.cache_manager import CacheManager, CACHE_FRESH, is_full_screenshot
+from services.screenshot_service import ScreenshotService
+
+class CachePrewarmer:
+    """Фоновый прогрев кэша скриншотов перед предсказуемыми волнами запросов.
+
+    Время запросов по каждому формату сохраняется в журнал. Из журнала
+    определяются интервалы суток, в которые запросы повторяются изо дня в день.
+    Незадолго до такого интервала скриншот рендерится заранее. Записи,
+    которые скоро истекут, обновляются, если по ним ожидается спрос.
+    """
+
+    def __init__(self, screenshot_service: ScreenshotService, cache_manager: CacheManager,
+                 log_file: str = "request_log.json", daily_budget: int = 24,
+                 slot_minutes: int = 15, lead_minutes: int = 5, min_days: int = 2,
+                 history_days: int = 14, check_interval: int = 60):
+        self.screenshot_service = screenshot_service
+        self.cache_manager = cache_manager
+        self.log_file = log_file
+        self.daily_budget = daily_budget
+        self.slot_minutes = slot_minutes
+        self.lead_minutes = lead_minutes
+        self.min_days = min_days
+        self.history_days = history_days
+        self.check_interval = check_interval
+
+        self._requests: List[Tuple[float, str]] = self._load_log()
+        self._log_dirty = False
+        self._warmed: Set[Tuple[str, int, str]] = set()
+        self._refreshed: Set[str] = set()
+        self._budget_day = datetime.now().date()
+        self.renders_today = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def _load_log(self) -> List[Tuple[float, str]]:
+        """Загрузка журнала запросов"""
+        try:
+            if os.path.exists(self.log_file):
+                with open(self.log_file, 'r') as f:
+                    return [(entry['timestamp'], entry['format']) for entry in json.load(f)]
+        except Exception as e:
+            logger.error(f"Error loading request log: {e}")
+        return []
+
+    def _write_log(self, entries: List[Tuple[float, str]]) -> bool:
+        """Запись журнала в файл (синхронно, выполняется в отдельном потоке)"""
+        try:
+            with open(self.log_file, 'w') as f:
+                json.dump([{'timestamp': ts, 'format': fmt} for ts, fmt in entries], f)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving request log: {e}")
+            return False
+
+    async def _save_log(self):
+        """Сохранение журнала запросов с удалением устаревших записей"""
+        # Очистка выполняется в event loop, где record_request дополняет журнал,
+        # в поток передаётся готовый снимок
+        cutoff = (datetime.now() - timedelta(days=self.history_days)).timestamp()
+        self._requests = [(ts, fmt) for ts, fmt in self._requests if ts >= cutoff]
+        self._log_dirty = False
+        if not await asyncio.to_thread(self._write_log, list(self._requests)):
+            self._log_dirty = True
+
+    def record_request(self, format: str):
+        """Регистрирует пользовательский запрос скриншота"""
+        self._requests.append((datetime.now().timestamp(), format))
+        self._log_dirty = True
+
+    def _slot_of(self, moment: datetime) -> int:
+        """Номер интервала суток для момента времени"""
+        return (moment.hour * 60 + moment.minute) // self.slot_minutes
+
+    def _slot_start(self, day: datetime, slot: int) -> datetime:
+        """Начало интервала суток"""
+        midnight = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight + timedelta(minutes=slot * self.slot_minutes)
+
+    def predict_slots(self) -> Dict[str, Set[int]]:
+        """Интервалы суток, в которые по каждому формату ожидается спрос.
+
+        Интервал считается предсказуемым, если запросы в нём были
+        как минимум в min_days разных дней.
+        """
+        days_by_slot: Dict[Tuple[str, int], Set[str]] = defaultdict(set)
+        for ts, fmt in self._requests:
+            moment = datetime.fromtimestamp(ts)
+            days_by_slot[(fmt, self._slot_of(moment))].add(moment.strftime('%Y%m%d'))
+
+        predicted: Dict[str, Set[int]] = defaultdict(set)
+        for (fmt, slot), days in days_by_slot.items():
+            if len(days) >= self.min_days:
+                predicted[fmt].add(slot)
+        return dict(predicted)
+
+    def _upcoming(self, now: datetime, predicted: Dict[str, Set[int]]) -> List[Tuple[str, datetime]]:
+        """Форматы и начала интервалов, спрос в которых наступит в пределах упреждения"""
+        upcoming = []
+        for fmt, slots in predicted.items():
+            for slot in slots:
+                start = self._slot_start(now, slot)
+                if start <= now:
+                    start = self._slot_start(now + timedelta(days=1), slot)
+                if start - now <= timedelta(minutes=self.lead_minutes):
+                    upcoming.append((fmt, start))
+        return upcoming
+
+    def _has_budget(self) -> bool:
+        """Проверка дневного лимита запросов к APIFlash на прогрев"""
+        today = datetime.now().date()
+        if today != self._budget_day:
+            self._budget_day = today
+            self.renders_today = 0
+            self._warmed.clear()
+            self._refreshed.clear()
+        return self.renders_today < self.daily_budget
+
+    async def _render(self, format: str, version_time: Optional[datetime] = None,
+                      force_refresh: bool = False) -> bool:
+        """Рендер скриншота в кэш с учётом лимита"""
+        if not self._has_budget():
+            logger.warning("Prewarm budget exhausted for today")
+            return False
+
+        result = await self.screenshot_service.get_screenshot_result(
+            format, force_refresh=force_refresh, version_time=version_time,
+            priority=Priority.PREWARM
+        )
+        # Устаревшая запись тоже означает рендер - он запускается в фоне
+        if result.cache_status != CACHE_FRESH:
+            self.renders_today += 1
+        return result.data is not None
+
+    def _order_formats(self, formats: List[str]) -> List[str]:
+        """Мастер-формат первым, чтобы производные форматы перекодировались из свежей копии"""
+        master = self.screenshot_service.master_format
+        return sorted(set(formats), key=lambda fmt: fmt != master)
+
+    async def run_once(self):
+        """Один цикл прогрева"""
+        now = datetime.now()
+        predicted = self.predict_slots()
+
+        # Прогрев перед ожидаемыми волнами запросов
+        for fmt, start in self._upcoming(now, predicted):
+            marker = (start.strftime('%Y%m%d'), self._slot_of(start), fmt)
+            if marker in self._warmed:
+                continue
+            if await self._render(fmt, version_time=start):
+                self._warmed.add(marker)
+                logger.info(f"Prewarmed {fmt} screenshot for {start.strftime('%H:%M')}")
+
+        # Обновление истекающих записей, по которым ожидается спрос
+        horizon = timedelta(minutes=self.lead_minutes + self.slot_minutes)
+        expiring = await self.cache_manager.aget_expiring_entries(self.lead_minutes * 60)
+        refresh_formats = []
+        for entry in expiring:
+            # Области и результаты обработки получаются из полного скриншота, прогревается только он
+            if entry['key'] in self._refreshed or not is_full_screenshot(entry['params']):
+                continue
+            fmt = entry['format']
+            expires_at = datetime.fromtimestamp(entry['expires_at'])
+            demand_soon = any(
+                self._slot_of(now + timedelta(minutes=m)) in predicted.get(fmt, set())
+                for m in range(0, int(horizon.total_seconds() // 60) + 1, self.slot_minutes)
+            )
+            if demand_soon:
+                refresh_formats.append((fmt, expires_at))
+                self._refreshed.add(entry['key'])
+
+        for fmt in self._order_formats([fmt for fmt, _ in refresh_formats]):
+            expires_at = max(exp for f, exp in refresh_formats if f == fmt)
+            if await self._render(fmt, version_time=expires_at, force_refresh=True):
+                logger.info(f"Refreshed expiring {fmt} screenshot")
+
+        if self._log_dirty:
+            await self._save_log()
+
+    async def _run(self):
+        """Периодический запуск прогрева"""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error in cache prewarmer: {e}")
+
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        """Запуск фонового прогрева"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+            logger.info("Started cache prewarmer")
+
+    async def stop(self):
+        """Остановка фонового прогрева с сохранением журнала"""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self._log_dirty:
+            await self._save_log()
+        logger.info("Stopped cache prewarmer")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика прогрева"""
+        predicted = self.predict_slots()
+        return {
+            "renders_today": self.renders_today,
+            "daily_budget": self.daily_budget,
+            "logged_requests": len(self._requests),
+            "predicted_slots": {
+                fmt: sorted(self._slot_start(datetime.now(), slot).strftime('%H:%M') for slot in slots)
+                for fmt, slots in predicted.items()
+            }
+        }
@@ -0,0 +1,259 @@
+import cv2
+import numpy as np
+import logging
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from services.image_codec import FORMAT_EXTENSIONS, encode_params
+from services.worker_pool import WorkerPool, get_image_pool
+
+logger = logging.getLogger(__name__)
+
+class Renderer(ABC):
+    """Общий интерфейс источников изображения дашборда"""
+
+    name: str = ''
+
+    @abstractmethod
+    async def render(self, format: str) -> Optional[bytes]:
+        """Возвращает закодированное изображение дашборда или None при ошибке"""
+
+# Цвета в BGR
+BACKGROUND = (248, 246, 244)
+HEADER = (64, 48, 33)
+TILE = (255, 255, 255)
+BORDER = (225, 220, 215)
+TEXT = (40, 40, 40)
+MUTED = (130, 130, 130)
+ACCENT = (200, 120, 30)
+POSITIVE = (80, 160, 60)
+NEGATIVE = (60, 60, 210)
+PLAN = (215, 210, 205)
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# Метрики дашборда: ключ, подпись, способ форматирования
+METRICS = [
+    ('revenue', 'Revenue', 'money'),
+    ('conversion', 'Conversion', 'percent'),
+    ('average_check', 'Average check', 'money'),
+]
+
+def _format_value(value: float, kind: str) -> str:
+    """Форматирование значения метрики для подписи"""
+    if kind == 'percent':
+        return f"{value * 100:.1f}%"
+    return f"{value:,.0f}".replace(',', ' ')
+
+def _text(image: np.ndarray, text: str, origin: Tuple[int, int], scale: float,
+          color: Tuple[int, int, int], thickness: int = 1):
+    cv2.putText(image, text, origin, FONT, scale, color, thickness, cv2.LINE_AA)
+
+def _sparkline(image: np.ndarray, values: List[float], box: Tuple[int, int, int, int],
+               color: Tuple[int, int, int]):
+    """Линия истории значений внутри прямоугольника (x, y, w, h)"""
+    if len(values) < 2:
+        return
+
+    x, y, w, h = box
+    series = np.asarray(values, dtype=np.float64)
+    low, high = series.min(), series.max()
+    span = high - low if high > low else 1.0
+
+    xs = x + np.linspace(0, w, len(series))
+    ys = y + h - (series - low) / span * h
+    points = np.stack([xs, ys], axis=1).round().astype(np.int32)
+
+    # Заливка под линией
+    polygon = np.vstack([points, [[x + w, y + h], [x, y + h]]])
+    overlay = image[y:y + h + 1, x:x + w + 1]
+    fill = overlay.copy()
+    cv2.fillPoly(fill, [polygon - [x, y]], color, cv2.LINE_AA)
+    cv2.addWeighted(fill, 0.15, overlay, 0.85, 0, dst=overlay)
+
+    cv2.polylines(image, [points], False, color, 2, cv2.LINE_AA)
+    cv2.circle(image, tuple(points[-1]), 4, color, -1, cv2.LINE_AA)
+
+def _bar_chart(image: np.ndarray, values: List[float], labels: List[str],
+               box: Tuple[int, int, int, int], color: Tuple[int, int, int]):
+    """Столбчатая диаграмма истории внутри прямоугольника (x, y, w, h)"""
+    if not values:
+        _text(image, "No history", (box[0], box[1] + box[3] // 2), 0.8, MUTED)
+        return
+
+    x, y, w, h = box
+    label_height = 28
+    chart_h = h - label_height
+    series = np.asarray(values, dtype=np.float64)
+    peak = series.max() if series.max() > 0 else 1.0
+
+    slot = w / len(series)
+    bar_w = max(int(slot * 0.6), 2)
+    heights = (series / peak * (chart_h - 24)).astype(np.int32)
+    lefts = (x + np.arange(len(series)) * slot + (slot - bar_w) / 2).astype(np.int32)
+
+    for left, bar_h, label in zip(lefts, heights, labels):
+        top = y + chart_h - int(bar_h)
+        image[top:y + chart_h, left:left + bar_w] = color
+        _text(image, label, (int(left), y + h - 6), 0.5, MUTED)
+
+def render_dashboard(metrics: Dict[str, Dict[str, float]],
+                     history: Dict[str, List[Tuple[datetime, float]]],
+                     format: str = 'png', width: int = 1600, height: int = 900,
+                     quality: int = 95, generated_at: Optional[datetime] = None) -> bytes:
+    """Отрисовка дашборда из значений метрик (синхронно, для пула потоков)
+
+    Args:
+        metrics: Результат GoogleSheetsService.get_metrics(include_plan=True)
+        history: Результат GoogleSheetsService.get_historical_data()
+        format: Формат изображения
+        width, height: Размер изображения
+        quality: Качество JPEG/WebP
+        generated_at: Время, указываемое в заголовке
+    """
+    if format not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unsupported format: {format}")
+
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = BACKGROUND
+
+    pad = 40
+    header_h = 90
+    image[:header_h] = HEADER
+    _text(image, "Sales dashboard", (pad, 58), 1.4, (255, 255, 255), 2)
+    stamp = (generated_at or datetime.now()).strftime('%Y-%m-%d %H:%M')
+    (stamp_w, _), _ = cv2.getTextSize(stamp, FONT, 0.8, 1)
+    _text(image, stamp, (width - pad - stamp_w, 55), 0.8, (220, 220, 220))
+
+    # Плитки KPI со спарклайнами
+    tile_top = header_h + pad
+    tile_h = int(height * 0.36)
+    tile_w = (width - pad * (len(METRICS) + 1)) // len(METRICS)
+
+    for i, (key, label, kind) in enumerate(METRICS):
+        left = pad + i * (tile_w + pad)
+        cv2.rectangle(image, (left, tile_top), (left + tile_w, tile_top + tile_h), TILE, -1)
+        cv2.rectangle(image, (left, tile_top), (left + tile_w, tile_top + tile_h), BORDER, 1)
+
+        value = metrics.get(key, {}).get('actual', 0.0)
+        points = [v for _, v in sorted(history.get(key, []), key=lambda item: item[0])]
+
+        _text(image, label, (left + 24, tile_top + 44), 0.9, MUTED)
+        _text(image, _format_value(value, kind), (left + 24, tile_top + 110), 1.8, TEXT, 3)
+
+        if points and points[-1]:
+            change = (value - points[-1]) / abs(points[-1]) * 100
+            color = POSITIVE if change >= 0 else NEGATIVE
+            _text(image, f"{change:+.1f}% vs previous", (left + 24, tile_top + 150), 0.7, color, 2)
+
+        _sparkline(image, points, (left + 24, tile_top + 170, tile_w - 48, tile_h - 200), ACCENT)
+
+    # План/факт по выручке
+    panel_top = tile_top + tile_h + pad
+    panel_h = height - panel_top - pad
+    plan_w = int(width * 0.4)
+    cv2.rectangle(image, (pad, panel_top), (pad + plan_w, panel_top + panel_h), TILE, -1)
+    cv2.rectangle(image, (pad, panel_top), (pad + plan_w, panel_top + panel_h), BORDER, 1)
+    _text(image, "Revenue: plan vs actual", (pad + 24, panel_top + 44), 0.9, MUTED)
+
+    revenue = metrics.get('revenue', {})
+    actual = revenue.get('actual', 0.0)
+    plan = revenue.get('plan', 0.0)
+    bar_left, bar_right = pad + 24, pad + plan_w - 24
+    bar_top = panel_top + panel_h // 2 - 20
+    image[bar_top:bar_top + 40, bar_left:bar_right] = PLAN
+    if plan > 0:
+        ratio = actual / plan
+        filled = int((bar_right - bar_left) * min(ratio, 1.0))
+        image[bar_top:bar_top + 40, bar_left:bar_left + filled] = POSITIVE if ratio >= 1 else ACCENT
+        _text(image, f"{ratio * 100:.0f}% of plan", (bar_left, bar_top + 90), 1.2, TEXT, 2)
+        _text(
+            image,
+            f"{_format_value(actual, 'money')} / {_format_value(plan, 'money')}",
+            (bar_left, bar_top - 20), 0.8, MUTED
+        )
+    else:
+        _text(image, "Plan is not set", (bar_left, bar_top + 90), 1.0, MUTED)
+
+    # История выручки
+    chart_left = pad * 2 + plan_w
+    chart_w = width - chart_left - pad
+    cv2.rectangle(image, (chart_left, panel_top), (chart_left + chart_w, panel_top + panel_h), TILE, -1)
+    cv2.rectangle(image, (chart_left, panel_top), (chart_left + chart_w, panel_top + panel_h), BORDER, 1)
+    _text(image, "Revenue history", (chart_left + 24, panel_top + 44), 0.9, MUTED)
+
+    revenue_history = sorted(history.get('revenue', []), key=lambda item: item[0])
+    _bar_chart(
+        image,
+        [v for _, v in revenue_history],
+        [d.strftime('%d.%m') for d, _ in revenue_history],
+        (chart_left + 24, panel_top + 64, chart_w - 48, panel_h - 84),
+        ACCENT
+    )
+
+    success, buffer = cv2.imencode(FORMAT_EXTENSIONS[format], image, encode_params(format, quality))
+    if not success:
+        raise ValueError(f"Failed to encode dashboard as {format}")
+    return buffer.tobytes()
+
+class NativeDashboardRenderer(Renderer):
+    """Рендер дашборда напрямую из данных Google Sheets, без APIFlash"""
+
+    name = 'native'
+
+    def __init__(self, sheets_service, worker_pool: Optional[WorkerPool] = None,
+                 width: int = 1600, height: int = 900, history_days: int = 7, quality: int = 95):
+        self.sheets_service = sheets_service
+        self.worker_pool = worker_pool or get_image_pool()
+        self.width = width
+        self.height = height
+        self.history_days = history_days
+        self.quality = quality
+
+    async def render(self, format: str) -> Optional[bytes]:
+        try:
+            metrics = await self.sheets_service.get_metrics(include_plan=True)
+            if not metrics:
+                return None
+            history = await self.sheets_service.get_historical_data(days=self.history_days)
+
+            started = time.perf_counter()
+            data = await self.worker_pool.run(
+                render_dashboard, metrics, history, format, self.width, self.height, self.quality
+            )
+            logger.info(f"Native dashboard rendered in {(time.perf_counter() - started) * 1000:.0f} ms")
+            return data
+
+        except Exception as e:
+            logger.error(f"Error rendering native dashboard: {e}")
+            return None
+
+def synthetic_data(days: int = 7) -> Tuple[Dict[str, Dict[str, float]], Dict[str, List[Tuple[datetime, float]]]]:
+    """Синтетические данные для офлайн-бенчмарка"""
+    rng = np.random.default_rng(42)
+    now = datetime.now()
+    dates = [now - timedelta(days=days - i) for i in range(days)]
+    history = {
+        'revenue': list(zip(dates, (rng.normal(1_200_000, 150_000, days)).tolist())),
+        'conversion': list(zip(dates, rng.uniform(0.02, 0.05, days).tolist())),
+        'average_check': list(zip(dates, rng.normal(3500, 400, days).tolist())),
+    }
+    metrics = {
+        'revenue': {'actual': 1_310_000.0, 'plan': 1_500_000.0},
+        'conversion': {'actual': 0.034},
+        'average_check': {'actual': 3720.0},
+    }
+    return metrics, history
+
+if __name__ == '__main__':
+    # Офлайн-бенчмарк: python -m services.dashboard_renderer
+    metrics, history = synthetic_data()
+    for fmt in ('png', 'jpeg', 'webp'):
+        render_dashboard(metrics, history, fmt)
+        runs = 20
+        started = time.perf_counter()
+        for _ in range(runs):
+            size = len(render_dashboard(metrics, history, fmt))
+        elapsed = (time.perf_counter() - started) / runs * 1000
+        print(f"{fmt:5s}: {elapsed:6.1f} ms/render, {size / 1024:.0f} KiB")
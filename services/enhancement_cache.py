@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from utils.logger import logger
+from services.cache_manager import CacheManager
+from services.image_enhancer import EnhancementPreset
+
+@dataclass
+class EnhancedEntry:
+    """Сохранённый результат улучшения"""
+    file_id: Optional[str] = None  # file_id уже отправленного документа в Telegram
+    data: Optional[bytes] = None   # байты, если документ ещё не отправлялся
+
+class EnhancementCache:
+    """Кэш результатов улучшения по исходному файлу и параметрам пресета.
+
+    Хранится в CacheManager (общие вытеснение и статистика). Ключ - file_unique_id
+    исходного документа и параметры пресета. После отправки к записи добавляется
+    file_id улучшенного документа, и повторный запрос не требует ни обработки,
+    ни загрузки файла.
+    """
+
+    FILE_ID = 'telegram_file_id'
+
+    def __init__(self, cache_manager: CacheManager, ttl_seconds: int = 7 * 24 * 3600):
+        self.cache_manager = cache_manager
+        self.ttl_seconds = ttl_seconds
+        self.file_id_hits = 0
+        self.data_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _params(source_id: str, preset: EnhancementPreset) -> Dict[str, Any]:
+        return {
+            'kind': 'enhanced',
+            'source_id': source_id,
+            'clip_limit': preset.clip_limit,
+            'sharpness': preset.sharpness,
+            'tile_grid': list(preset.tile_grid),
+            'format': preset.format
+        }
+
+    async def lookup(self, source_id: str, preset: EnhancementPreset) -> Optional[EnhancedEntry]:
+        """Поиск результата: сначала file_id отправленного документа, затем сами данные"""
+        params = self._params(source_id, preset)
+
+        file_id = (await self.cache_manager.aget_entry_attributes(params, record_hit=True)).get(self.FILE_ID)
+        if file_id:
+            self.file_id_hits += 1
+            logger.info(f"Enhanced document reused by file_id for {source_id}")
+            return EnhancedEntry(file_id=file_id)
+
+        data = await self.cache_manager.aget(params, preset.format)
+        if data is not None:
+            self.data_hits += 1
+            return EnhancedEntry(data=data)
+
+        self.misses += 1
+        return None
+
+    async def get_data(self, source_id: str, preset: EnhancementPreset) -> Optional[bytes]:
+        """Байты результата без учёта file_id (если Telegram отклонил сохранённый file_id)"""
+        return await self.cache_manager.aget(self._params(source_id, preset), preset.format)
+
+    async def store(self, source_id: str, preset: EnhancementPreset, data: bytes):
+        """Сохранение результата улучшения"""
+        await self.cache_manager.aput(
+            self._params(source_id, preset), preset.format, data,
+            soft_ttl=self.ttl_seconds, hard_ttl=self.ttl_seconds
+        )
+
+    async def remember_file_id(self, source_id: str, preset: EnhancementPreset, file_id: Optional[str]):
+        """Привязка file_id отправленного документа к записи (None - забыть)"""
+        await self.cache_manager.aset_entry_attribute(self._params(source_id, preset), self.FILE_ID, file_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кэша улучшений"""
+        total = self.file_id_hits + self.data_hits + self.misses
+        return {
+            "file_id_hits": self.file_id_hits,
+            "data_hits": self.data_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.file_id_hits + self.data_hits) / total * 100, 1) if total else 0
+        }
@@ -0,0 +1,60 @@
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from utils.logger import logger
+
+class FileIdCache:
+    """Соответствие sha256 содержимого и file_id уже загруженного в Telegram файла.
+
+    Повторная отправка тех же байтов ссылается на file_id и не загружает
+    файл заново. Если Telegram отклоняет file_id, запись удаляется и файл
+    загружается обычным образом.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, digest: str, size: int = 0) -> Optional[str]:
+        """file_id для содержимого или None, если оно ещё не загружалось"""
+        file_id = self._entries.get(digest)
+        if file_id is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        self.bytes_saved += size
+        logger.info(f"Reusing Telegram file_id for content {digest[:12]}")
+        return file_id
+
+    def remember(self, digest: str, file_id: str):
+        """Запоминает file_id загруженного файла"""
+        self._entries[digest] = file_id
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def forget(self, digest: str):
+        """Удаляет file_id, отклонённый Telegram"""
+        if self._entries.pop(digest, None) is not None:
+            self.invalidations += 1
+            logger.warning(f"Telegram file_id for content {digest[:12]} invalidated")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика повторного использования file_id"""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "bytes_saved": self.bytes_saved
+        }
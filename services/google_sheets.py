@@ -4,6 +4,9 @@ from googleapiclient.errors import HttpError
 from config import SPREADSHEET_ID, SHEET_NAME, CREDENTIALS_FILE
 from utils.logger import logger
 from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
 import re
 from datetime import datetime, timedelta
 
@@ -42,10 +45,11 @@ class GoogleSheetsService:
                 f'{SHEET_NAME}!A3',  # План выручки
             ]
 
-            result = sheet.values().batchGet(
+            request = sheet.values().batchGet(
                 spreadsheetId=SPREADSHEET_ID,
                 ranges=ranges
-            ).execute()
+            )
+            result = await asyncio.to_thread(request.execute)
 
             metrics = {}
             metric_names = ['revenue', 'conversion', 'average_check']
@@ -91,10 +95,11 @@ class GoogleSheetsService:
         """Get historical data for metrics over specified period"""
         try:
             sheet = self.service.spreadsheets()
-            result = sheet.values().get(
+            request = sheet.values().get(
                 spreadsheetId=SPREADSHEET_ID,
                 range=f'{SHEET_NAME}!A2:H{2+days}'
-            ).execute()
+            )
+            result = await asyncio.to_thread(request.execute)
 
             values = result.get('values', [])
             historical_data = {
@@ -133,10 +138,11 @@ class GoogleSheetsService:
     async def get_chart_range(self):
         try:
             sheet = self.service.spreadsheets()
-            result = sheet.values().get(
+            request = sheet.values().get(
                 spreadsheetId=SPREADSHEET_ID,
                 range=f'{SHEET_NAME}!A:A'
-            ).execute()
+            )
+            result = await asyncio.to_thread(request.execute)
 
             values = result.get('values', [])
             if not values:
@@ -149,4 +155,27 @@ class GoogleSheetsService:
             raise
         except Exception as e:
             logger.error(f"Error getting chart range: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    async def get_data_fingerprint(self, ranges: List[str]) -> Optional[str]:
+        """
+        Computes a fingerprint of the sheet data in the given ranges.
+        A single batchGet returning only values keeps the check cheap.
+
+        Args:
+            ranges: A1-notation ranges to watch
+        """
+        try:
+            request = self.service.spreadsheets().values().batchGet(
+                spreadsheetId=SPREADSHEET_ID,
+                ranges=ranges,
+                fields='valueRanges(range,values)'
+            )
+            result = await asyncio.to_thread(request.execute)
+
+            payload = json.dumps(result.get('valueRanges', []), sort_keys=True, ensure_ascii=False)
+            return hashlib.sha256(payload.encode()).hexdigest()
+
+        except Exception as e:
+            logger.error(f"Error computing data fingerprint: {str(e)}")
+            return None
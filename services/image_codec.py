@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Расширения файлов для cv2.imencode
+FORMAT_EXTENSIONS = {
+    'png': '.png',
+    'jpeg': '.jpg',
+    'webp': '.webp'
+}
+
+def encode_params(format: str, quality: int) -> List[int]:
+    """Параметры кодировщика OpenCV для формата и качества"""
+    if format == 'jpeg':
+        return [cv2.IMWRITE_JPEG_QUALITY, min(max(quality, 0), 100)]
+    if format == 'webp':
+        return [cv2.IMWRITE_WEBP_QUALITY, min(max(quality, 1), 100)]
+    return []
+
+def decode(image_data: bytes, flags: int = cv2.IMREAD_UNCHANGED) -> np.ndarray:
+    """Декодирование изображения в массив"""
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), flags)
+    if image is None:
+        raise ValueError("Failed to decode source image")
+    return image
+
+def encode(image: np.ndarray, format: str, quality: int = 100) -> bytes:
+    """Кодирование массива в формат"""
+    if format not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unsupported format: {format}")
+
+    if format == 'jpeg' and image.ndim == 3 and image.shape[2] == 4:
+        # JPEG не поддерживает прозрачность
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+
+    success, buffer = cv2.imencode(FORMAT_EXTENSIONS[format], image, encode_params(format, quality))
+    if not success:
+        raise ValueError(f"Failed to encode image as {format}")
+
+    return buffer.tobytes()
+
+def transcode(image_data: bytes, format: str, quality: int = 100) -> bytes:
+    """Перекодирование изображения в другой формат (синхронно, для пула потоков)"""
+    if format not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unsupported format: {format}")
+
+    # JPEG не поддерживает прозрачность, поэтому альфа-канал сохраняем только для PNG/WebP
+    flags = cv2.IMREAD_COLOR if format == 'jpeg' else cv2.IMREAD_UNCHANGED
+    return encode(decode(image_data, flags), format, quality)
+
+# Флаги декодирования с уменьшением: JPEG масштабируется прямо при декодировании (DCT)
+REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+def preview(image_data: bytes, max_width: int = 1280, quality: int = 80,
+            source_width: int = 0) -> bytes:
+    """Уменьшенная JPEG-копия для быстрого предпросмотра (синхронно, для пула потоков)
+
+    Args:
+        image_data: Исходное изображение
+        max_width: Ширина предпросмотра
+        quality: Качество JPEG
+        source_width: Ширина исходника, если известна: позволяет декодировать
+            сразу в уменьшенном виде (IMREAD_REDUCED_*)
+    """
+    flags = cv2.IMREAD_COLOR
+    for factor, reduced in REDUCED_FLAGS:
+        if source_width and source_width // factor >= max_width:
+            flags = reduced
+            break
+
+    image = decode(image_data, flags)
+    height, width = image.shape[:2]
+    if width > max_width:
+        image = cv2.resize(image, (max_width, round(height * max_width / width)), interpolation=cv2.INTER_AREA)
+    return encode(image, 'jpeg', quality)
+
+def crop(image: np.ndarray, box: Tuple[int, int, int, int]) -> np.ndarray:
+    """Вырезка области (x, y, w, h) срезом без копирования данных.
+
+    Область обрезается по границам изображения.
+    """
+    x, y, w, h = box
+    height, width = image.shape[:2]
+    left, top = min(max(x, 0), width), min(max(y, 0), height)
+    right, bottom = min(max(x + w, 0), width), min(max(y + h, 0), height)
+    if right <= left or bottom <= top:
+        raise ValueError(f"Region {box} is outside of the {width}x{height} image")
+    return image[top:bottom, left:right]
@@ -0,0 +1,134 @@
+import cv2
+import hashlib
+import numpy as np
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+from services.image_codec import crop, decode, encode
+from services.worker_pool import WorkerPool, get_image_pool
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ImageSignature:
+    """Отпечаток отправленного изображения для сравнения со следующим"""
+    digest: str  # sha256 байтов: одинаковые файлы сравниваются без декодирования
+    phash: int
+    data: bytes  # сжатое изображение: полноразмерная копия без декодированного массива в памяти
+    size: Tuple[int, int]  # (ширина, высота) исходника
+    sent_at: Optional[datetime] = None
+
+@dataclass
+class DiffResult:
+    """Результат сравнения с последним отправленным изображением"""
+    changed: bool
+    signature: ImageSignature
+    box: Optional[Tuple[int, int, int, int]] = None  # изменившаяся область (x, y, w, h)
+    distance: int = 0  # расстояние Хэмминга между перцептивными хэшами
+    previous_sent_at: Optional[datetime] = None
+
+def perceptual_hash(gray: np.ndarray) -> int:
+    """64-битный pHash: знаки низкочастотных коэффициентов DCT относительно медианы"""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+def hamming(first: int, second: int) -> int:
+    return bin(first ^ second).count('1')
+
+def diff_box(first: np.ndarray, second: np.ndarray, threshold: int = 24,
+             min_pixels: int = 1) -> Optional[Tuple[int, int, int, int]]:
+    """Ограничивающий прямоугольник пикселей, различающихся больше чем на threshold
+
+    Returns:
+        (x, y, w, h) или None, если различающихся пикселей меньше min_pixels
+    """
+    mask = cv2.absdiff(first, second) > threshold
+    if np.count_nonzero(mask) < min_pixels:
+        return None
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1)
+
+def highlight(image_data: bytes, box: Tuple[int, int, int, int], margin: int = 40) -> bytes:
+    """Фрагмент с изменившейся областью, обведённой рамкой (синхронно, для пула потоков)"""
+    image = decode(image_data, cv2.IMREAD_COLOR)
+    x, y, w, h = box
+    left, top = max(x - margin, 0), max(y - margin, 0)
+    fragment = crop(image, (left, top, w + 2 * margin, h + 2 * margin)).copy()
+    cv2.rectangle(fragment, (x - left, y - top), (x - left + w - 1, y - top + h - 1), (0, 0, 255), 3)
+    return encode(fragment, 'png')
+
+class DiffTracker:
+    """Сравнение нового скриншота с последним отправленным в тот же чат.
+
+    Побайтно одинаковые файлы распознаются по sha256. Иначе изображения
+    сравниваются в полном разрешении: изменение одной цифры - это несколько
+    пикселей, которые при уменьшении сглаживаются ниже порога. Перцептивный
+    хэш дополнительно ловит плавные изменения по всему изображению
+    (цвет, яркость), не дающие резкой попиксельной разницы.
+    """
+
+    def __init__(self, worker_pool: Optional[WorkerPool] = None, threshold: int = 24,
+                 min_pixels: int = 1, phash_distance: int = 6, max_entries: int = 200):
+        self.worker_pool = worker_pool or get_image_pool()
+        self.threshold = threshold
+        self.min_pixels = min_pixels
+        self.phash_distance = phash_distance
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, ImageSignature]" = OrderedDict()
+
+    def compare(self, previous: Optional[ImageSignature], image_data: bytes) -> DiffResult:
+        """Сравнение с предыдущим отпечатком (синхронно, для пула потоков)"""
+        digest = hashlib.sha256(image_data).hexdigest()
+        if previous is not None and previous.digest == digest:
+            return DiffResult(False, previous, previous_sent_at=previous.sent_at)
+
+        gray = decode(image_data, cv2.IMREAD_GRAYSCALE)
+        height, width = gray.shape
+        signature = ImageSignature(digest, perceptual_hash(gray), image_data, (width, height))
+        if previous is None:
+            return DiffResult(True, signature)
+
+        distance = hamming(previous.phash, signature.phash)
+        if previous.size != signature.size:
+            return DiffResult(True, signature, (0, 0, width, height), distance, previous.sent_at)
+
+        box = diff_box(decode(previous.data, cv2.IMREAD_GRAYSCALE), gray, self.threshold, self.min_pixels)
+        if box is None and distance >= self.phash_distance:
+            # Резких отличий нет, но изображение в целом другое
+            box = (0, 0, width, height)
+        if box is None:
+            return DiffResult(False, signature, distance=distance, previous_sent_at=previous.sent_at)
+        return DiffResult(True, signature, box, distance, previous.sent_at)
+
+    async def check(self, key: str, image_data: bytes) -> Optional[DiffResult]:
+        """Сравнение с последним изображением, отправленным по ключу (чат и вид скриншота)
+
+        Returns:
+            Результат сравнения или None, если сравнить не удалось
+        """
+        try:
+            result = await self.worker_pool.run(self.compare, self._entries.get(key), bytes(image_data))
+        except Exception as e:
+            logger.warning(f"Image diff skipped for {key}: {e}")
+            return None
+
+        if result.changed and result.previous_sent_at is None:
+            logger.info(f"No previous image to compare for {key}")
+        elif result.changed:
+            logger.info(f"Dashboard changed for {key}: box={result.box}, phash distance={result.distance}")
+        else:
+            logger.info(f"Dashboard unchanged for {key} since {result.previous_sent_at}")
+        return result
+
+    def remember(self, key: str, result: DiffResult, sent_at: Optional[datetime] = None):
+        """Запоминает отправленное изображение как базу для следующего сравнения"""
+        result.signature.sent_at = sent_at or datetime.now()
+        self._entries.pop(key, None)
+        self._entries[key] = result.signature
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -1,40 +1,253 @@
 import cv2
 import numpy as np
 import logging
-from typing import Optional
+import os
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from services.image_codec import FORMAT_EXTENSIONS, encode_params
+from services.image_optimizer import ImageOptimizer
+from services.worker_pool import PoolSaturatedError, WorkerPool, get_image_pool
+from config import ENHANCE_STRIP_MIN_HEIGHT, ENHANCE_STRIP_WORKERS
 
 logger = logging.getLogger(__name__)
 
+@dataclass(frozen=True)
+class EnhancementPreset:
+    """Параметры улучшения изображения"""
+    title: str
+    clip_limit: float
+    sharpness: float
+    tile_grid: Tuple[int, int] = (8, 8)
+    format: str = 'png'
+
+# Пресеты улучшения; 'classic' повторяет исходный фильтр бота (CLAHE 2.0, ядро с центром 9)
+PRESETS: Dict[str, EnhancementPreset] = {
+    'default': EnhancementPreset('Стандартный', 0.8, 3.4),
+    'high_contrast': EnhancementPreset('Высокий контраст', 1.2, 3.8),
+    'text_optimal': EnhancementPreset('Для текста', 0.6, 4.0),
+    'chart_optimal': EnhancementPreset('Для графиков', 1.0, 3.0),
+    'classic': EnhancementPreset('Классический', 2.0, 9.0),
+}
+
+def sharpen_kernel(sharpness: float) -> np.ndarray:
+    """Ядро повышения резкости: центр sharpness, соседи -(sharpness - 1) / 8 (сумма 1)"""
+    kernel = np.full((3, 3), -(sharpness - 1) / 8, np.float32)
+    kernel[1, 1] = sharpness
+    return kernel
+
+class EnhancementPipeline:
+    """Скомпилированный пресет: ядро и параметры кодировщика вычисляются один раз,
+    объекты CLAHE создаются по одному на поток и переиспользуются.
+
+    Высокие изображения (от strip_min_height строк) обрабатываются параллельно
+    горизонтальными полосами. Границы полос совпадают с границами строк плиток
+    CLAHE всего изображения, и к каждой полосе добавляется по строке плиток
+    сверху и снизу. Поэтому каждая плитка получает ту же гистограмму, что и
+    при обработке целиком, а интерполяция и фильтр резкости на границах полос
+    видят настоящих соседей. Отличия от обработки целиком - только от округления
+    весов интерполяции CLAHE: ±1 уровень L у единичных пикселей (миллионные доли),
+    после перевода в BGR до нескольких уровней. Фильтр резкости усиливает их
+    до (2 * sharpness - 1) раз. Допуск проверяется в tests/test_enhancement_strips.py.
+    """
+
+    def __init__(self, preset: EnhancementPreset, strip_executor: Optional[Executor] = None,
+                 strip_count: int = 1, strip_min_height: int = ENHANCE_STRIP_MIN_HEIGHT,
+                 optimizer: Optional[ImageOptimizer] = None):
+        if preset.format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unsupported format: {preset.format}")
+
+        self.preset = preset
+        self.kernel = sharpen_kernel(preset.sharpness)
+        self.extension = FORMAT_EXTENSIONS[preset.format]
+        self.encode_params = encode_params(preset.format, 100)
+        self.strip_executor = strip_executor
+        self.strip_count = strip_count
+        self.strip_min_height = strip_min_height
+        self.optimizer = optimizer
+        self._local = threading.local()
+
+    def _clahe(self, tile_rows: Optional[int] = None) -> cv2.CLAHE:
+        """CLAHE текущего потока (объект хранит рабочие буферы и не потокобезопасен)"""
+        tiles_x, tiles_y = self.preset.tile_grid
+        tile_rows = tile_rows or tiles_y
+
+        cache = getattr(self._local, 'clahe', None)
+        if cache is None:
+            cache = self._local.clahe = {}
+        clahe = cache.get(tile_rows)
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=self.preset.clip_limit, tileGridSize=(tiles_x, tile_rows))
+            cache[tile_rows] = clahe
+        return clahe
+
+    def _contrast(self, image: np.ndarray, tile_rows: Optional[int] = None) -> np.ndarray:
+        """Улучшение контраста по каналу яркости"""
+        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+        return cv2.cvtColor(cv2.merge((self._clahe(tile_rows).apply(l), a, b)), cv2.COLOR_LAB2BGR)
+
+    def enhance(self, image: np.ndarray) -> np.ndarray:
+        """Улучшение декодированного изображения BGR"""
+        if self.strip_executor is not None and self.strip_count > 1 \
+                and image.shape[0] >= self.strip_min_height:
+            return self.enhance_strips(image)
+
+        # Увеличение резкости после контраста
+        return cv2.filter2D(self._contrast(image), -1, self.kernel)
+
+    def _padding(self, height: int, width: int) -> Tuple[int, int]:
+        """Дополнение снизу и справа, которое CLAHE делает перед расчётом гистограмм.
+
+        Если хотя бы одна сторона не делится на число плиток, OpenCV дополняет
+        отражением (BORDER_REFLECT_101) обе стороны на tiles - size % tiles,
+        то есть кратную сторону - на целую плитку.
+        """
+        tiles_x, tiles_y = self.preset.tile_grid
+        if height % tiles_y == 0 and width % tiles_x == 0:
+            return 0, 0
+        return tiles_y - height % tiles_y, tiles_x - width % tiles_x
+
+    def _strip_bounds(self, height: int, width: int) -> Tuple[int, int, List[Tuple[int, int]]]:
+        """Высота строки плиток CLAHE, дополнение справа и диапазоны строк плиток для полос"""
+        tiles_y = self.preset.tile_grid[1]
+        pad_bottom, pad_right = self._padding(height, width)
+        tile_h = (height + pad_bottom) // tiles_y
+
+        groups = np.array_split(np.arange(tiles_y), min(self.strip_count, tiles_y))
+        return tile_h, pad_right, [(int(g[0]), int(g[-1]) + 1) for g in groups if len(g)]
+
+    def _enhance_strip(self, image: np.ndarray, output: np.ndarray, tile_h: int, pad_right: int,
+                       first: int, last: int):
+        """Обработка полосы из строк плиток [first, last) с запасом в строку плиток"""
+        height, width = image.shape[:2]
+        tiles_y = self.preset.tile_grid[1]
+        ext_first, ext_last = max(first - 1, 0), min(last + 1, tiles_y)
+        top, bottom = ext_first * tile_h, ext_last * tile_h
+        rows = min(bottom, height) - top
+
+        strip = image[top:top + rows]
+        if bottom > height or pad_right:
+            # Полосу дополняем так же, как CLAHE дополняет целое изображение,
+            # чтобы размер плиток совпал с обработкой целиком
+            strip = cv2.copyMakeBorder(strip, 0, bottom - top - rows, 0, pad_right, cv2.BORDER_REFLECT_101)
+
+        # Дополнение нужно только для гистограмм плиток, резкость - по реальным пикселям
+        contrasted = self._contrast(strip, ext_last - ext_first)[:rows, :width]
+        sharpened = cv2.filter2D(contrasted, -1, self.kernel)
+
+        core_top, core_bottom = first * tile_h, min(last * tile_h, height)
+        output[core_top:core_bottom] = sharpened[core_top - top:core_bottom - top]
+
+    def enhance_strips(self, image: np.ndarray) -> np.ndarray:
+        """Параллельное улучшение горизонтальными полосами"""
+        tile_h, pad_right, groups = self._strip_bounds(*image.shape[:2])
+        output = np.empty_like(image)
+
+        futures = [
+            self.strip_executor.submit(self._enhance_strip, image, output, tile_h, pad_right, first, last)
+            for first, last in groups
+        ]
+        for future in futures:
+            future.result()
+        return output
+
+    def __call__(self, image_data: bytes) -> bytes:
+        """Декодирование, улучшение и кодирование (синхронно, для пула потоков)"""
+        image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Failed to decode image")
+
+        enhanced = self.enhance(image)
+        success, buffer = cv2.imencode(self.extension, enhanced, self.encode_params)
+        if not success:
+            raise ValueError("Failed to encode enhanced image")
+        if self.optimizer is not None:
+            # Уже выполняется в потоке пула, поэтому оптимизация синхронная
+            return self.optimizer.optimize(buffer.tobytes(), self.preset.format, image=enhanced).data
+        return buffer.tobytes()
+
 class ImageEnhancer:
+    def __init__(self, worker_pool: Optional[WorkerPool] = None, metrics=None,
+                 strip_workers: int = ENHANCE_STRIP_WORKERS,
+                 strip_min_height: int = ENHANCE_STRIP_MIN_HEIGHT,
+                 optimizer: Optional[ImageOptimizer] = None):
+        self.worker_pool = worker_pool or get_image_pool()
+        self.metrics = metrics  # BotMetrics для учёта времени по пресетам
+        self.optimizer = optimizer  # Подбор кодирования минимального размера для результата
+        self._pipelines: Dict[EnhancementPreset, EnhancementPipeline] = {}
+
+        # Отдельный пул для полос: задача улучшения уже занимает поток общего пула
+        self.strip_workers = strip_workers or os.cpu_count() or 1
+        self.strip_min_height = strip_min_height
+        self._strip_executor: Optional[ThreadPoolExecutor] = None
+
     @staticmethod
-    async def enhance_image(image_data: bytes) -> Optional[bytes]:
-        """Улучшение качества изображения"""
-        try:
-            # Конвертируем bytes в numpy array
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            # Применяем улучшение контраста
-            lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-            l, a, b = cv2.split(lab)
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            cl = clahe.apply(l)
-            enhanced_lab = cv2.merge((cl,a,b))
-            enhanced = cv2.cvtColor(enhanced_lab, cv2.COLOR_LAB2BGR)
-
-            # Применяем увеличение резкости
-            kernel = np.array([[-1,-1,-1],
-                             [-1, 9,-1],
-                             [-1,-1,-1]])
-            enhanced = cv2.filter2D(enhanced, -1, kernel)
-
-            # Кодируем обратно в bytes
-            success, buffer = cv2.imencode('.png', enhanced)
-            if not success:
-                raise ValueError("Failed to encode enhanced image")
-
-            return buffer.tobytes()
+    def get_preset_options() -> Dict[str, str]:
+        """Возвращает словарь пресетов с описаниями"""
+        return {name: preset.title for name, preset in PRESETS.items()}
+
+    def get_pipeline(self, preset: EnhancementPreset) -> EnhancementPipeline:
+        """Скомпилированный конвейер для пресета (для именованных пресетов создаётся один раз)"""
+        pipeline = self._pipelines.get(preset)
+        if pipeline is None:
+            if self._strip_executor is None and self.strip_workers > 1:
+                self._strip_executor = ThreadPoolExecutor(
+                    max_workers=self.strip_workers,
+                    thread_name_prefix="enhance-strip"
+                )
+            pipeline = EnhancementPipeline(
+                preset,
+                strip_executor=self._strip_executor,
+                strip_count=self.strip_workers,
+                strip_min_height=self.strip_min_height,
+                optimizer=self.optimizer
+            )
+            # Произвольные параметры не кэшируются: каждое новое сочетание добавляло бы запись
+            if preset in PRESETS.values():
+                self._pipelines[preset] = pipeline
+        return pipeline
 
+    async def _run(self, image_data: bytes, preset: EnhancementPreset, label: str) -> Optional[bytes]:
+        """Выполнение конвейера в общем пуле с учётом времени
+
+        Raises:
+            PoolSaturatedError: пул перегружен, запрос нужно повторить позже
+        """
+        command = f"enhance:{label}"
+        started = self.metrics.start_command_tracking(command) if self.metrics else time.time()
+        try:
+            data = await self.worker_pool.run(self.get_pipeline(preset), bytes(image_data))
+        except PoolSaturatedError:
+            raise
         except Exception as e:
-            logger.error(f"Error enhancing image: {e}")
-            return None
\ No newline at end of file
+            logger.error(f"Error enhancing image ({label}): {e}")
+            if self.metrics:
+                self.metrics.end_command_tracking(command, started, success=False)
+            return None
+
+        if self.metrics:
+            self.metrics.end_command_tracking(command, started)
+        return data
+
+    async def enhance_preset(self, image_data: bytes, preset: str = 'default') -> Optional[bytes]:
+        """Улучшение изображения по именованному пресету"""
+        if preset not in PRESETS:
+            logger.error(f"Unknown enhancement preset: {preset}")
+            return None
+        return await self._run(image_data, PRESETS[preset], preset)
+
+    async def enhance_screenshot(self, image_data: bytes, clip_limit: float = 0.8,
+                                 sharpness: float = 3.4) -> Optional[bytes]:
+        """Улучшение изображения с произвольными параметрами"""
+        # Совпадающие с пресетом параметры используют его конвейер и учитываются под его именем
+        for name, preset in PRESETS.items():
+            if (preset.clip_limit, preset.sharpness) == (clip_limit, sharpness):
+                return await self._run(image_data, preset, name)
+        return await self._run(image_data, EnhancementPreset('Пользовательский', clip_limit, sharpness), 'custom')
+
+    async def enhance_image(self, image_data: bytes) -> Optional[bytes]:
+        """Улучшение качества изображения классическим фильтром"""
+        return await self.enhance_preset(image_data, 'classic')
@@ -0,0 +1,282 @@
+import cv2
+import numpy as np
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from services.image_codec import FORMAT_EXTENSIONS, decode
+from services.worker_pool import WorkerPool, get_image_pool
+
+logger = logging.getLogger(__name__)
+
+# Стратегии zlib для PNG, которые имеет смысл пробовать на скриншотах
+PNG_STRATEGIES = {
+    'default': cv2.IMWRITE_PNG_STRATEGY_DEFAULT,
+    'filtered': cv2.IMWRITE_PNG_STRATEGY_FILTERED,
+    'rle': cv2.IMWRITE_PNG_STRATEGY_RLE,
+}
+
+# Фильтры строк PNG (IMWRITE_PNG_FILTER есть только в новых версиях OpenCV)
+PNG_FILTERS = {
+    name: getattr(cv2, flag)
+    for name, flag in (
+        ('none', 'IMWRITE_PNG_FILTER_NONE'),
+        ('sub', 'IMWRITE_PNG_FILTER_SUB'),
+        ('up', 'IMWRITE_PNG_FILTER_UP'),
+        ('paeth', 'IMWRITE_PNG_FILTER_PAETH'),
+        ('fast', 'IMWRITE_PNG_FAST_FILTERS'),
+        ('all', 'IMWRITE_PNG_ALL_FILTERS'),
+    )
+    if hasattr(cv2, 'IMWRITE_PNG_FILTER') and hasattr(cv2, flag)
+}
+
+@dataclass
+class OptimizedImage:
+    """Результат оптимизации кодирования"""
+    data: bytes
+    format: str
+    original_size: int
+    method: str  # как получен результат, например 'png-9-rle' или 'jpeg-q82'
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(self.original_size - self.size, 0)
+
+def ssim(first: np.ndarray, second: np.ndarray, scale: float = 1.0) -> float:
+    """Индекс структурного сходства по яркости (scale < 1 - по уменьшенным копиям)"""
+    def prepare(image: np.ndarray) -> np.ndarray:
+        if image.ndim == 3:
+            image = cv2.cvtColor(image[:, :, :3], cv2.COLOR_BGR2GRAY)
+        if scale != 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return image.astype(np.float32)
+
+    a, b = prepare(first), prepare(second)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    blur = lambda x: cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    mu_aa, mu_bb, mu_ab = mu_a * mu_a, mu_b * mu_b, mu_a * mu_b
+    sigma_aa = blur(a * a) - mu_aa
+    sigma_bb = blur(b * b) - mu_bb
+    sigma_ab = blur(a * b) - mu_ab
+
+    ssim_map = ((2 * mu_ab + c1) * (2 * sigma_ab + c2)) / ((mu_aa + mu_bb + c1) * (sigma_aa + sigma_bb + c2))
+    return float(ssim_map.mean())
+
+def _pack(image: np.ndarray) -> np.ndarray:
+    """Цвета BGR в виде одного uint32 на пиксель"""
+    pixels = image.reshape(-1, 3).astype(np.uint32)
+    return pixels[:, 0] | (pixels[:, 1] << 8) | (pixels[:, 2] << 16)
+
+def _unpack(packed: np.ndarray) -> np.ndarray:
+    return np.stack([packed & 0xFF, (packed >> 8) & 0xFF, (packed >> 16) & 0xFF], axis=1).astype(np.uint8)
+
+def quantize_palette(image: np.ndarray, max_colors: int = 256,
+                     min_coverage: float = 0.99, sample_step: int = 4) -> Optional[np.ndarray]:
+    """Сведение изображения из плоских цветов к палитре не более max_colors цветов.
+
+    Палитра - самые частые цвета. Если они покрывают меньше min_coverage пикселей
+    (фотография, градиенты), возвращается None. Цвета из палитры сохраняются
+    точно, остальные (сглаживание краёв) заменяются ближайшими из палитры.
+    """
+    if image.ndim != 3 or image.shape[2] != 3:
+        return None
+
+    sample = _pack(np.ascontiguousarray(image[::sample_step, ::sample_step]))
+    colors, counts = np.unique(sample, return_counts=True)
+    order = np.argsort(counts)[::-1][:max_colors]
+    if counts[order].sum() < min_coverage * sample.size:
+        return None
+
+    palette = np.sort(colors[order])
+    palette_bgr = _unpack(palette)
+
+    packed = _pack(image)
+    index = np.minimum(np.searchsorted(palette, packed), len(palette) - 1)
+    inexact = np.flatnonzero(palette[index] != packed)
+    if inexact.size:
+        # Ближайший цвет палитры считается один раз на каждый уникальный цвет
+        others, inverse = np.unique(packed[inexact], return_inverse=True)
+        others_bgr = _unpack(others).astype(np.int32)
+        nearest = np.empty(len(others), np.intp)
+        for start in range(0, len(others), 2048):
+            chunk = others_bgr[start:start + 2048]
+            distances = ((chunk[:, None, :] - palette_bgr[None, :, :].astype(np.int32)) ** 2).sum(axis=2)
+            nearest[start:start + 2048] = distances.argmin(axis=1)
+        index[inexact] = nearest[inverse.reshape(-1)]
+    return palette_bgr[index].reshape(image.shape)
+
+class ImageOptimizer:
+    """Подбор кодирования, минимизирующего размер файла.
+
+    PNG: уровень сжатия и стратегия zlib, для изображений из плоских цветов -
+    сведение к палитре. WebP: вариант без потерь. JPEG/WebP с потерями:
+    двоичный поиск наименьшего качества, при котором SSIM не ниже min_ssim,
+    или наибольшего качества, укладывающегося в target_bytes.
+    """
+
+    def __init__(self, worker_pool: Optional[WorkerPool] = None, png_levels: Tuple[int, ...] = (9,),
+                 png_strategies: Tuple[str, ...] = ('default',),
+                 png_filters: Tuple[str, ...] = ('none', 'up', 'fast'), palette_colors: int = 256,
+                 min_ssim: float = 0.997, target_bytes: int = 0, min_quality: int = 50):
+        self.worker_pool = worker_pool or get_image_pool()
+        self.png_levels = png_levels
+        self.png_strategies = png_strategies
+        self.png_filters = png_filters
+        self.palette_colors = palette_colors
+        self.min_ssim = min_ssim
+        self.target_bytes = target_bytes
+        self.min_quality = min_quality
+
+        self.optimized = 0
+        self.total_bytes_saved = 0
+
+    @staticmethod
+    def _encode(image: np.ndarray, format: str, params: List[int]) -> bytes:
+        success, buffer = cv2.imencode(FORMAT_EXTENSIONS[format], image, params)
+        if not success:
+            raise ValueError(f"Failed to encode image as {format}")
+        return buffer.tobytes()
+
+    def _png_candidates(self, image: np.ndarray, lossless: bool = False) -> List[Tuple[bytes, str]]:
+        """Варианты PNG: перебор уровня сжатия, стратегии и фильтра строк.
+
+        Если сведение к палитре не меняет изображение заметно (SSIM не ниже
+        min_ssim), перебор идёт по нему: меньше цветов - длиннее повторы для zlib.
+        С lossless палитра не используется.
+        """
+        source, label = image, 'png'
+        if self.palette_colors and not lossless:
+            quantized = quantize_palette(image, self.palette_colors)
+            if quantized is not None and ssim(image, quantized) >= self.min_ssim:
+                source, label = quantized, 'png-palette'
+
+        filters = [f for f in self.png_filters if f in PNG_FILTERS] or [None]
+        candidates = []
+        for level in self.png_levels:
+            for strategy in self.png_strategies:
+                for row_filter in filters:
+                    params = [cv2.IMWRITE_PNG_COMPRESSION, level, cv2.IMWRITE_PNG_STRATEGY, PNG_STRATEGIES[strategy]]
+                    method = f"{label}-{level}-{strategy}"
+                    if row_filter is not None:
+                        params += [cv2.IMWRITE_PNG_FILTER, PNG_FILTERS[row_filter]]
+                        method += f"-{row_filter}"
+                    candidates.append((self._encode(source, 'png', params), method))
+        return candidates
+
+    def _search_quality(self, image: np.ndarray, format: str) -> Optional[Tuple[bytes, str]]:
+        """Двоичный поиск качества JPEG/WebP под целевой размер или порог SSIM
+
+        Если целевой размер недостижим, возвращается самый маленький из вариантов.
+        """
+        flag = cv2.IMWRITE_JPEG_QUALITY if format == 'jpeg' else cv2.IMWRITE_WEBP_QUALITY
+        low, high = self.min_quality, 100
+        best: Optional[Tuple[bytes, str]] = None
+        smallest: Optional[Tuple[bytes, str]] = None
+
+        while low <= high:
+            quality = (low + high) // 2
+            data = self._encode(image, format, [flag, quality])
+            if smallest is None or len(data) < len(smallest[0]):
+                smallest = (data, f"{format}-q{quality}")
+
+            if self.target_bytes:
+                acceptable = len(data) <= self.target_bytes
+            else:
+                decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+                acceptable = ssim(image, decoded) >= self.min_ssim
+
+            if self.target_bytes:
+                # Наибольшее качество, укладывающееся в размер
+                if acceptable:
+                    best, low = (data, f"{format}-q{quality}"), quality + 1
+                else:
+                    high = quality - 1
+            else:
+                # Наименьшее качество с допустимым SSIM
+                if acceptable:
+                    best, high = (data, f"{format}-q{quality}"), quality - 1
+                else:
+                    low = quality + 1
+
+        return best or (smallest if self.target_bytes else None)
+
+    def optimize(self, image_data: bytes, format: str,
+                 image: Optional[np.ndarray] = None, lossless: bool = False) -> OptimizedImage:
+        """Подбор самого компактного кодирования (синхронно, для пула потоков)
+
+        Args:
+            image_data: Текущее закодированное изображение (результат не будет больше него)
+            format: Целевой формат
+            image: Уже декодированное изображение, если есть
+            lossless: Только варианты без потерь (для изображений, из которых получают другие)
+        """
+        if format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unsupported format: {format}")
+
+        flags = cv2.IMREAD_COLOR if format == 'jpeg' else cv2.IMREAD_UNCHANGED
+        if image is None:
+            image = decode(image_data, flags)
+        if image.ndim == 3 and image.shape[2] == 4 and (format == 'jpeg' or (image[:, :, 3] == 255).all()):
+            # Непрозрачный альфа-канал только увеличивает файл
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+
+        candidates: List[Tuple[bytes, str]] = [(image_data, 'original')]
+        if format == 'png':
+            candidates.extend(self._png_candidates(image, lossless))
+        else:
+            if format == 'webp':
+                candidates.append((self._encode(image, 'webp', [cv2.IMWRITE_WEBP_QUALITY, 101]), 'webp-lossless'))
+            searched = None if lossless else self._search_quality(image, format)
+            if searched is not None:
+                candidates.append(searched)
+
+        if self.target_bytes:
+            fitting = [c for c in candidates if len(c[0]) <= self.target_bytes]
+            candidates = fitting or candidates
+        data, method = min(candidates, key=lambda c: len(c[0]))
+
+        result = OptimizedImage(data=data, format=format, original_size=len(image_data), method=method)
+        self.optimized += 1
+        self.total_bytes_saved += result.bytes_saved
+        logger.info(
+            f"Optimized {format}: {result.original_size} -> {result.size} bytes "
+            f"(-{result.bytes_saved}, {method})"
+        )
+        return result
+
+    async def optimize_async(self, image_data: bytes, format: str, lossless: bool = False) -> OptimizedImage:
+        """Оптимизация в пуле потоков"""
+        return await self.worker_pool.run(self.optimize, image_data, format, None, lossless)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика оптимизации"""
+        return {
+            "optimized": self.optimized,
+            "bytes_saved": self.total_bytes_saved
+        }
+
+_image_optimizer: Optional[ImageOptimizer] = None
+
+def get_image_optimizer() -> Optional[ImageOptimizer]:
+    """Общий оптимизатор кодирования (None, если оптимизация отключена)"""
+    global _image_optimizer
+    from config import (
+        IMAGE_OPTIMIZE,
+        IMAGE_OPTIMIZE_MIN_SSIM,
+        IMAGE_OPTIMIZE_TARGET_KB,
+        IMAGE_OPTIMIZE_PALETTE_COLORS
+    )
+    if not IMAGE_OPTIMIZE:
+        return None
+    if _image_optimizer is None:
+        _image_optimizer = ImageOptimizer(
+            min_ssim=IMAGE_OPTIMIZE_MIN_SSIM,
+            target_bytes=IMAGE_OPTIMIZE_TARGET_KB * 1024,
+            palette_colors=IMAGE_OPTIMIZE_PALETTE_COLORS
+        )
+    return _image_optimizer
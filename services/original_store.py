@@ -0,0 +1,49 @@
+import time
+from typing import Optional
+from utils.logger import logger
+from services.cache_manager import MemoryCache
+
+class OriginalStore:
+    """Кратковременное хранение исходных байтов отправленных скриншотов.
+
+    Ключ - чат и сообщение с документом. Обработчик улучшения берёт исходник
+    отсюда и скачивает файл из Telegram только при промахе.
+    """
+
+    def __init__(self, ttl_seconds: int = 600, max_size_mb: int = 64):
+        self.ttl_seconds = ttl_seconds
+        self._entries = MemoryCache(max_size_mb)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(chat_id: int, message_id: int) -> str:
+        return f"{chat_id}:{message_id}"
+
+    def put(self, chat_id: int, message_id: int, data: bytes):
+        """Запоминает исходник отправленного документа"""
+        self._entries.put(self._key(chat_id, message_id), bytes(data), time.monotonic())
+
+    def get(self, chat_id: int, message_id: int) -> Optional[bytes]:
+        """Исходник документа из сообщения или None, если он истёк или вытеснен"""
+        key = self._key(chat_id, message_id)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] <= self.ttl_seconds:
+            self.hits += 1
+            logger.info(f"Original for message {key} served locally")
+            return entry[0]
+
+        if entry is not None:
+            self._entries.remove(key)
+        self.misses += 1
+        return None
+
+_original_store: Optional[OriginalStore] = None
+
+def get_original_store() -> OriginalStore:
+    """Общее хранилище исходников для всех обработчиков бота"""
+    global _original_store
+    if _original_store is None:
+        from config import ORIGINALS_TTL, ORIGINALS_MAX_MB
+        _original_store = OriginalStore(ttl_seconds=ORIGINALS_TTL, max_size_mb=ORIGINALS_MAX_MB)
+    return _original_store
@@ -0,0 +1,90 @@
+import random
+import time
+from collections import deque
+from typing import Deque, Optional
+from utils.logger import logger
+
+class CircuitBreaker:
+    """Размыкатель цепи для внешнего сервиса.
+
+    После failure_threshold ошибок подряд цепь размыкается и запросы не
+    выполняются recovery_timeout секунд. Затем пропускается один пробный
+    запрос: успех замыкает цепь, ошибка снова её размыкает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60, name: str = "service"):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Можно ли выполнить запрос сейчас"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"Circuit breaker '{self.name}' half-open, probing")
+
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        """Учёт успешного запроса"""
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit breaker '{self.name}' closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Пробный запрос завершился без ответа сервиса (отмена, отказ планировщика):
+        следующий запрос снова может стать пробным"""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """Учёт неудачного запроса"""
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(
+                    f"Circuit breaker '{self.name}' opened after "
+                    f"{self.consecutive_failures} consecutive failures"
+                )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+class LatencyTracker:
+    """Скользящее окно длительностей успешных запросов"""
+
+    def __init__(self, window: int = 100, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Перцентиль длительности (None, пока данных недостаточно)"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+def backoff_delay(attempt: int, base: float = 1.0, maximum: float = 10.0) -> float:
+    """Экспоненциальная задержка перед повтором с полным джиттером"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
@@ -1,19 +1,108 @@
 import aiohttp
+import asyncio
+import io
 import logging
-from typing import Optional
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Optional, Dict, Tuple, Any, Callable, Awaitable, List
+import numpy as np
+from services.apiflash_scheduler import ApiFlashScheduler, Priority, QuotaExceededError
+from services.cache_manager import CacheManager, CACHE_STALE, CACHE_MISS
+from services.dashboard_renderer import Renderer
+from services.image_codec import crop, decode, encode, transcode
+from services.image_optimizer import ImageOptimizer
+from services.resilience import CircuitBreaker, LatencyTracker, backoff_delay
+from services.worker_pool import WorkerPool, get_image_pool
 from config import (
     APIFLASH_KEY,
     APIFLASH_URL,
     SPREADSHEET_URL,
     SCREENSHOT_WIDTH,
     SCREENSHOT_HEIGHT,
-    SCREENSHOT_QUALITY
+    SCREENSHOT_QUALITY,
+    SCREENSHOT_REGIONS,
+    APIFLASH_POOL_LIMIT,
+    APIFLASH_LIMIT_PER_HOST,
+    APIFLASH_KEEPALIVE_TIMEOUT,
+    APIFLASH_CONNECT_TIMEOUT,
+    APIFLASH_TOTAL_TIMEOUT,
+    APIFLASH_DNS_CACHE_TTL,
+    APIFLASH_CHUNK_SIZE,
+    APIFLASH_MAX_BYTES,
+    APIFLASH_MAX_CONCURRENCY,
+    APIFLASH_RATE_PER_MINUTE,
+    APIFLASH_BURST,
+    APIFLASH_MONTHLY_QUOTA,
+    APIFLASH_QUOTA_FILE,
+    APIFLASH_ATTEMPT_TIMEOUT,
+    APIFLASH_RETRIES,
+    APIFLASH_BACKOFF_BASE,
+    APIFLASH_BACKOFF_MAX,
+    APIFLASH_HEDGE,
+    APIFLASH_BREAKER_THRESHOLD,
+    APIFLASH_BREAKER_RECOVERY,
+    SCREENSHOT_TRANSCODE,
+    CACHE_FINGERPRINT_CHECK_INTERVAL
 )
 
 logger = logging.getLogger(__name__)
 
-class ScreenshotService:
-    def __init__(self):
+# Обратный вызов о постановке в очередь: (позиция, оценка ожидания в секундах)
+QueueCallback = Callable[[int, float], Any]
+
+class ApiFlashError(Exception):
+    """Ошибка запроса к APIFlash"""
+
+    def __init__(self, message: str, retriable: bool = True):
+        super().__init__(message)
+        self.retriable = retriable
+
+@dataclass
+class ScreenshotResult:
+    """Результат получения скриншота"""
+    data: Optional[bytes]
+    format: str
+    shared: bool = False  # True, если вызов присоединился к уже идущему запросу
+    cache_tier: Optional[str] = None  # 'memory' или 'disk', если результат взят из кэша
+    cache_status: str = CACHE_MISS  # 'fresh', 'stale' или 'miss'
+    fallback: bool = False  # APIFlash недоступен, отдана последняя сохранённая копия
+    renderer: str = 'apiflash'  # источник изображения: APIFlash или альтернативный рендер
+
+    @property
+    def cached(self) -> bool:
+        """Результат получен из кэша без ожидания APIFlash"""
+        return self.cache_status != CACHE_MISS
+
+    @property
+    def stale(self) -> bool:
+        """Результат устарел, обновление запущено в фоне"""
+        return self.cache_status == CACHE_STALE
+
+    @property
+    def led(self) -> bool:
+        """Вызов сам инициировал запрос к APIFlash"""
+        return not self.shared
+
+class ScreenshotService(Renderer):
+    name = 'apiflash'
+
+    def __init__(self,
+                 pool_limit: int = APIFLASH_POOL_LIMIT,
+                 limit_per_host: int = APIFLASH_LIMIT_PER_HOST,
+                 keepalive_timeout: float = APIFLASH_KEEPALIVE_TIMEOUT,
+                 connect_timeout: float = APIFLASH_CONNECT_TIMEOUT,
+                 total_timeout: float = APIFLASH_TOTAL_TIMEOUT,
+                 cache_manager: Optional[CacheManager] = None,
+                 transcode_locally: bool = SCREENSHOT_TRANSCODE,
+                 worker_pool: Optional[WorkerPool] = None,
+                 fingerprint_provider: Optional[Callable[[], Awaitable[Optional[str]]]] = None,
+                 fingerprint_check_interval: float = CACHE_FINGERPRINT_CHECK_INTERVAL,
+                 scheduler: Optional[ApiFlashScheduler] = None,
+                 api_url: str = APIFLASH_URL,
+                 renderers: Optional[Dict[str, Renderer]] = None,
+                 regions: Optional[Dict[str, List[int]]] = None,
+                 optimizer: Optional[ImageOptimizer] = None):
         self.formats = ['png', 'jpeg', 'webp']
         self._default_params = {
             'width': str(SCREENSHOT_WIDTH),
@@ -22,32 +111,624 @@ class ScreenshotService:
             'full_page': 'true'
         }
 
-    async def get_screenshot(self, format: str = 'png') -> Optional[bytes]:
-        """Асинхронное получение скриншота"""
+        # Параметры пула соединений
+        self.pool_limit = pool_limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout,
+            sock_connect=connect_timeout
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self.api_url = api_url
+
+        # Устойчивость: таймаут попытки, повторы, дублирующие запросы, размыкатель цепи
+        self.attempt_timeout = APIFLASH_ATTEMPT_TIMEOUT
+        self.retries = APIFLASH_RETRIES
+        self.backoff_base = APIFLASH_BACKOFF_BASE
+        self.backoff_max = APIFLASH_BACKOFF_MAX
+        self.hedge_enabled = APIFLASH_HEDGE
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(
+            failure_threshold=APIFLASH_BREAKER_THRESHOLD,
+            recovery_timeout=APIFLASH_BREAKER_RECOVERY,
+            name="apiflash"
+        )
+
+        # Потоковое чтение ответа с ограничением размера
+        self.chunk_size = APIFLASH_CHUNK_SIZE
+        self.max_bytes = APIFLASH_MAX_BYTES
+
+        self.cache_manager = cache_manager
+
+        # Очередь с приоритетами, ограничением параллельности, частоты и квоты
+        self.scheduler = scheduler or ApiFlashScheduler(
+            max_concurrency=APIFLASH_MAX_CONCURRENCY,
+            rate_per_minute=APIFLASH_RATE_PER_MINUTE,
+            burst=APIFLASH_BURST,
+            monthly_quota=APIFLASH_MONTHLY_QUOTA,
+            quota_file=APIFLASH_QUOTA_FILE
+        )
+
+        # Режим «один захват — много форматов»: APIFlash рендерит только PNG,
+        # остальные форматы кодируются локально из него
+        self.master_format = 'png'
+        self.transcode_locally = transcode_locally
+        self.worker_pool = worker_pool or get_image_pool()
+        # Перекодирование в минимальный размер перед сохранением в кэш
+        self.optimizer = optimizer
+
+        # Валидация кэша по отпечатку данных таблицы вместо часовых интервалов
+        self.fingerprint_provider = fingerprint_provider
+        self.fingerprint_check_interval = fingerprint_check_interval
+        self._fingerprint: Optional[str] = None
+        self._fingerprint_checked_at: Optional[float] = None
+        self._fingerprint_lock = asyncio.Lock()
+
+        # Запросы к APIFlash, выполняющиеся в данный момент
+        self._inflight: Dict[Tuple[str, ...], asyncio.Task] = {}
+
+        # Альтернативные источники изображения, выбираемые на уровне запроса
+        self.renderers: Dict[str, Renderer] = dict(renderers or {})
+
+        # Именованные области (x, y, w, h), вырезаемые из мастер-копии
+        self.regions: Dict[str, Tuple[int, int, int, int]] = {
+            name.lower(): tuple(int(v) for v in box)
+            for name, box in (SCREENSHOT_REGIONS if regions is None else regions).items()
+        }
+        # Последняя декодированная мастер-копия: области, запрошенные подряд, режутся из неё
+        # без повторного декодирования. Через decoded_master_ttl секунд после последней
+        # вырезки массив освобождается, чтобы не держать несжатое изображение всё время работы
+        self.decoded_master_ttl = 30.0
+        self._decoded_master: Optional[Tuple[bytes, np.ndarray]] = None
+        self._decoded_master_release: Optional[asyncio.TimerHandle] = None
+
+    def register_renderer(self, renderer: Renderer):
+        """Регистрация альтернативного источника изображения"""
+        self.renderers[renderer.name] = renderer
+
+    async def start(self):
+        """Создание долгоживущей HTTP-сессии с пулом соединений"""
+        if self._session is not None and not self._session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=APIFLASH_DNS_CACHE_TTL
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        logger.info(
+            f"APIFlash HTTP session started (limit={self.pool_limit}, "
+            f"per_host={self.limit_per_host}, keepalive={self.keepalive_timeout}s)"
+        )
+
+    async def close(self):
+        """Закрытие HTTP-сессии и освобождение соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("APIFlash HTTP session closed")
+        self._session = None
+        self._release_decoded_master()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую сессию, создавая её при первом обращении"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    @staticmethod
+    def _request_key(params: Dict[str, Any]) -> Tuple[str, ...]:
+        """Ключ, по которому объединяются одинаковые одновременные запросы"""
+        return tuple(f"{name}={value}" for name, value in sorted(params.items()))
+
+    def _cache_params(self, format: str, fingerprint: Optional[str] = None,
+                      version_time: Optional[datetime] = None) -> Dict[str, Any]:
+        """Параметры, определяющие содержимое скриншота (без ключа доступа)"""
+        params = {
+            'url': SPREADSHEET_URL,
+            'format': format,
+            **self._default_params
+        }
+        if self._is_derived(format):
+            # Производный вариант хранится рядом с мастер-копией того же периода
+            params['source_format'] = self.master_format
+        if fingerprint:
+            params['data_fingerprint'] = fingerprint
+        elif version_time is not None:
+            # Явная часовая версия: рендер заранее для наступающего часа
+            params['cache_hour'] = version_time.strftime('%Y%m%d%H')
+        return params
+
+    async def _current_fingerprint(self) -> Optional[str]:
+        """Текущий отпечаток данных таблицы (проверяется не чаще заданного интервала)"""
+        if self.fingerprint_provider is None:
+            return None
+
+        async with self._fingerprint_lock:
+            now = time.monotonic()
+            if (self._fingerprint_checked_at is not None
+                    and now - self._fingerprint_checked_at < self.fingerprint_check_interval):
+                return self._fingerprint
+
+            fingerprint = await self.fingerprint_provider()
+            self._fingerprint_checked_at = now
+
+            # fingerprint is None: таблица недоступна, до следующей проверки кэш версионируется по часам
+            if fingerprint is not None and fingerprint != self._fingerprint:
+                if self._fingerprint is not None:
+                    logger.info("Sheet data changed, invalidating cached screenshots")
+                if self.cache_manager is not None:
+                    await self.cache_manager.ainvalidate_fingerprint(fingerprint)
+
+            self._fingerprint = fingerprint
+            return fingerprint
+
+    def _is_derived(self, format: str) -> bool:
+        """Формат получается локальным перекодированием мастер-копии"""
+        return self.transcode_locally and format != self.master_format
+
+    async def _store(self, format: str, data: Optional[bytes], params: Dict[str, Any]):
+        """Сохранение результата в кэш (запись на диск - в пуле ввода-вывода кэша)"""
+        if data and self.cache_manager is not None:
+            await self.cache_manager.aput(params, format, data)
+
+    async def _optimize(self, format: str, data: Optional[bytes], lossless: bool = False) -> Optional[bytes]:
+        """Уменьшение размера изображения; при ошибке возвращается исходное"""
+        if not data or self.optimizer is None:
+            return data
         try:
-            if format not in self.formats:
-                raise ValueError(f"Unsupported format: {format}")
+            return (await self.optimizer.optimize_async(data, format, lossless)).data
+        except Exception as e:
+            logger.warning(f"Image optimization skipped ({format}): {e}")
+            return data
 
-            params = {
-                'access_key': APIFLASH_KEY,
-                'url': SPREADSHEET_URL,
-                'format': format,
-                **self._default_params
-            }
+    async def _fetch_and_cache(self, format: str, params: Dict[str, Any],
+                               priority: Priority = Priority.INTERACTIVE,
+                               on_queued: Optional[QueueCallback] = None) -> ScreenshotResult:
+        """Запрос к APIFlash с сохранением результата в кэш"""
+        # Из мастер-копии получают другие форматы и области, поэтому она сжимается только без потерь
+        lossless = format == self.master_format
+        data = await self._optimize(format, await self._fetch(format, priority, on_queued), lossless)
+        await self._store(format, data, params)
+        return ScreenshotResult(data=data, format=format)
 
-            logger.info(f"Making APIFlash request for format: {format}")
+    async def _from_master(self, format: str, data: bytes, params: Dict[str, Any],
+                           master: ScreenshotResult) -> ScreenshotResult:
+        """Результат, полученный из мастер-копии.
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(APIFLASH_URL, params=params) as response:
-                    if response.status != 200:
-                        logger.error(f"APIFlash error: {response.status}")
-                        return None
+        Полученное из резервной копии (APIFlash недоступен) в кэш не сохраняется
+        и остаётся помеченным как устаревшее.
+        """
+        data = await self._optimize(format, data)
+        if master.fallback:
+            logger.warning(f"{format} built from fallback {self.master_format} master, not caching")
+            return ScreenshotResult(
+                data=data,
+                format=format,
+                cache_tier=master.cache_tier,
+                cache_status=master.cache_status,
+                fallback=True
+            )
+        await self._store(format, data, params)
+        return ScreenshotResult(data=data, format=format)
 
-                    return await response.read()
+    async def _get_master(self, version_time: Optional[datetime] = None,
+                          priority: Priority = Priority.INTERACTIVE,
+                          on_queued: Optional[QueueCallback] = None) -> ScreenshotResult:
+        """Актуальная мастер-копия PNG для получения производных изображений"""
+        master = await self.get_screenshot_result(
+            self.master_format, version_time=version_time, priority=priority, on_queued=on_queued
+        )
+        if master.stale:
+            # Производное изображение строим из обновлённой мастер-копии (её обновление уже запущено)
+            master = await self.get_screenshot_result(
+                self.master_format, force_refresh=True, version_time=version_time,
+                priority=priority, on_queued=on_queued
+            )
+        return master
 
+    async def _derive_and_cache(self, format: str, params: Dict[str, Any],
+                                version_time: Optional[datetime] = None,
+                                priority: Priority = Priority.INTERACTIVE,
+                                on_queued: Optional[QueueCallback] = None) -> ScreenshotResult:
+        """Получение формата из мастер-копии PNG локальным перекодированием"""
+        master = await self._get_master(version_time, priority, on_queued)
+        if not master.data:
+            return ScreenshotResult(data=None, format=format)
+
+        try:
+            data = await self.worker_pool.run(
+                transcode, master.data, format, int(self._default_params['quality'])
+            )
         except Exception as e:
-            logger.error(f"Error in screenshot service: {e}")
+            logger.error(f"Error transcoding screenshot to {format}: {e}")
+            return ScreenshotResult(data=None, format=format)
+
+        logger.info(f"Derived {format} from {self.master_format} master locally")
+        return await self._from_master(format, data, params, master)
+
+    def _crop_region(self, master_data: bytes, box: Tuple[int, int, int, int],
+                     format: str, quality: int) -> bytes:
+        """Вырезка и кодирование области мастер-копии (синхронно, для пула потоков)"""
+        decoded = self._decoded_master
+        if decoded is not None and decoded[0] is master_data:
+            image = decoded[1]
+        else:
+            image = decode(master_data)
+            self._decoded_master = (master_data, image)
+        return encode(crop(image, box), format, quality)
+
+    def _schedule_master_release(self):
+        """Откладывает освобождение декодированной мастер-копии на decoded_master_ttl секунд"""
+        if self._decoded_master_release is not None:
+            self._decoded_master_release.cancel()
+        self._decoded_master_release = asyncio.get_running_loop().call_later(
+            self.decoded_master_ttl, self._release_decoded_master
+        )
+
+    def _release_decoded_master(self):
+        if self._decoded_master_release is not None:
+            self._decoded_master_release.cancel()
+            self._decoded_master_release = None
+        self._decoded_master = None
+
+    async def _crop_and_cache(self, region: str, format: str, params: Dict[str, Any],
+                              version_time: Optional[datetime] = None,
+                              priority: Priority = Priority.INTERACTIVE,
+                              on_queued: Optional[QueueCallback] = None) -> ScreenshotResult:
+        """Получение области из мастер-копии с сохранением в кэш"""
+        master = await self._get_master(version_time, priority, on_queued)
+        if not master.data:
+            return ScreenshotResult(data=None, format=format)
+
+        try:
+            data = await self.worker_pool.run(
+                self._crop_region, master.data, self.regions[region], format,
+                int(self._default_params['quality'])
+            )
+        except Exception as e:
+            logger.error(f"Error cropping region '{region}': {e}")
+            return ScreenshotResult(data=None, format=format)
+        finally:
+            self._schedule_master_release()
+
+        logger.info(f"Cropped region '{region}' from {self.master_format} master ({format})")
+        return await self._from_master(format, data, params, master)
+
+    def _start_flight(self, key: Tuple[str, ...],
+                      factory: Callable[[], Awaitable[ScreenshotResult]]) -> Tuple[asyncio.Task, bool]:
+        """Возвращает выполняющуюся операцию с этим ключом или запускает новую"""
+        task = self._inflight.get(key)
+        if task is not None:
+            return task, True
+
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task, False
+
+    async def _single_flight(self, key: Tuple[str, ...],
+                             factory: Callable[[], Awaitable[ScreenshotResult]]) -> Tuple[ScreenshotResult, bool]:
+        """Выполняет операцию один раз для всех одновременных вызовов с одинаковым ключом.
+
+        Returns:
+            Tuple[ScreenshotResult, bool]: результат и флаг присоединения к уже идущей операции
+        """
+        task, shared = self._start_flight(key, factory)
+
+        # shield: отмена одного ожидающего не должна прерывать операцию для остальных
+        result = await asyncio.shield(task)
+        return result, shared
+
+    def _render_factory(self, format: str, params: Dict[str, Any],
+                        version_time: Optional[datetime] = None,
+                        priority: Priority = Priority.INTERACTIVE,
+                        on_queued: Optional[QueueCallback] = None) -> Callable[[], Awaitable[ScreenshotResult]]:
+        """Операция получения нового изображения для формата"""
+        if self._is_derived(format):
+            return lambda: self._derive_and_cache(format, params, version_time, priority, on_queued)
+        return lambda: self._fetch_and_cache(format, params, priority, on_queued)
+
+    async def _request(self, params: Dict[str, str]) -> bytes:
+        """Один HTTP-запрос к APIFlash"""
+        session = await self._get_session()
+        try:
+            async with session.get(self.api_url, params=params) as response:
+                if response.status != 200:
+                    # 429 и 5xx - временные сбои, остальные коды повторять бессмысленно
+                    retriable = response.status == 429 or response.status >= 500
+                    raise ApiFlashError(f"APIFlash error: {response.status}", retriable=retriable)
+
+                return await self._read_body(response)
+        except aiohttp.ClientError as e:
+            raise ApiFlashError(f"APIFlash connection error: {e}") from e
+
+    async def _attempt(self, format: str, priority: Priority = Priority.INTERACTIVE,
+                       on_queued: Optional[QueueCallback] = None,
+                       slot_acquired: Optional[asyncio.Event] = None) -> bytes:
+        """Одна попытка: слот планировщика и запрос с ограничением по времени
+
+        Args:
+            slot_acquired: Устанавливается, когда попытка получила слот и запрос отправлен
+        """
+        params = {
+            'access_key': APIFLASH_KEY,
+            'url': SPREADSHEET_URL,
+            'format': format,
+            **self._default_params
+        }
+
+        async with self.scheduler.slot(priority, on_queued):
+            if slot_acquired is not None:
+                slot_acquired.set()
+            logger.info(f"Making APIFlash request for format: {format}")
+            started = time.monotonic()
+            try:
+                data = await asyncio.wait_for(self._request(params), self.attempt_timeout)
+            except asyncio.TimeoutError:
+                raise ApiFlashError(f"APIFlash request timed out after {self.attempt_timeout}s")
+
+            self.latency.record(time.monotonic() - started)
+            return data
+
+    async def _attempt_hedged(self, format: str, priority: Priority = Priority.INTERACTIVE,
+                              on_queued: Optional[QueueCallback] = None) -> bytes:
+        """Попытка с дублирующим запросом, если ответ дольше p95 обычной задержки.
+
+        Время отсчитывается от получения слота планировщика: ожидание в очереди
+        означает перегрузку, и дублирующий запрос её только усилил бы.
+        """
+        threshold = self.latency.percentile(95) if self.hedge_enabled else None
+        if threshold is None:
+            return await self._attempt(format, priority, on_queued)
+
+        slot_acquired = asyncio.Event()
+        primary = asyncio.ensure_future(self._attempt(format, priority, on_queued, slot_acquired))
+        slot_wait = asyncio.ensure_future(slot_acquired.wait())
+        try:
+            await asyncio.wait({primary, slot_wait}, return_when=asyncio.FIRST_COMPLETED)
+            if not primary.done():
+                await asyncio.wait({primary}, timeout=threshold)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        finally:
+            slot_wait.cancel()
+        if primary.done():
+            return primary.result()
+
+        logger.info(f"APIFlash response slower than p95 ({threshold:.1f}s), sending hedged request")
+        pending = {primary, asyncio.ensure_future(self._attempt(format, priority))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _fetch(self, format: str, priority: Priority = Priority.INTERACTIVE,
+                     on_queued: Optional[QueueCallback] = None) -> Optional[bytes]:
+        """Выполнение запроса к APIFlash с повторами и размыкателем цепи"""
+        for attempt in range(self.retries + 1):
+            probing = self.breaker.state != CircuitBreaker.CLOSED
+            if not self.breaker.allow_request():
+                logger.warning("APIFlash circuit is open, skipping request")
+                return None
+
+            try:
+                data = await self._attempt_hedged(format, priority, on_queued)
+                self.breaker.record_success()
+                return data
+
+            except QuotaExceededError as e:
+                logger.error(f"Error in screenshot service: {e}")
+                return None
+            except ApiFlashError as e:
+                logger.error(f"APIFlash attempt {attempt + 1}/{self.retries + 1} failed: {e}")
+                if not e.retriable:
+                    # Сервис ответил (4xx, слишком большой ответ): он доступен, повторять бессмысленно
+                    self.breaker.record_success()
+                    return None
+                self.breaker.record_failure()
+            except Exception as e:
+                logger.error(f"Error in screenshot service: {e}")
+                self.breaker.record_failure()
+            finally:
+                # Пробный запрос без учёта результата (квота, отмена) не должен оставлять цепь полуоткрытой
+                if probing:
+                    self.breaker.release_probe()
+
+            if attempt < self.retries:
+                await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+
+        return None
+
+    async def _read_body(self, response: aiohttp.ClientResponse) -> bytes:
+        """Потоковое чтение ответа с ограничением размера.
+
+        Изображение целиком нужно для кэша и отправки, поэтому собирается в памяти:
+        BytesIO растит один буфер и отдаёт его как bytes без копирования,
+        так что пик памяти не превышает размера изображения. Ответ с заявленным
+        размером больше max_bytes отклоняется до загрузки, без заявленного размера -
+        загрузка прерывается, как только превышен max_bytes.
+        """
+        if response.content_length is not None and response.content_length > self.max_bytes:
+            response.close()
+            raise ApiFlashError(
+                f"APIFlash response too large: {response.content_length} bytes", retriable=False
+            )
+
+        buffer = io.BytesIO()
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            if buffer.tell() + len(chunk) > self.max_bytes:
+                response.close()
+                raise ApiFlashError(
+                    f"APIFlash response exceeded {self.max_bytes} bytes, download aborted",
+                    retriable=False
+                )
+            buffer.write(chunk)
+        return buffer.getvalue()
+
+    async def _fallback(self, format: str) -> Optional[ScreenshotResult]:
+        """Последняя сохранённая копия на случай недоступности APIFlash"""
+        if self.cache_manager is None:
+            return None
+
+        data = await self.cache_manager.aget_latest_screenshot(format)
+        if data is None:
+            return None
+
+        logger.warning(f"Serving last cached {format} screenshot as fallback")
+        return ScreenshotResult(
+            data=data,
+            format=format,
+            cache_tier='disk',
+            cache_status=CACHE_STALE,
+            fallback=True
+        )
+
+    async def _optimize_render(self, renderer: Renderer, format: str) -> ScreenshotResult:
+        data = await self._optimize(format, await renderer.render(format))
+        return ScreenshotResult(data=data, format=format, renderer=renderer.name)
+
+    async def _render_with(self, renderer: Renderer, format: str) -> Optional[ScreenshotResult]:
+        """Рендер альтернативным источником (без кэша: данные всегда актуальны)"""
+        key = self._request_key({'renderer': renderer.name, 'format': format})
+        result, shared = await self._single_flight(
+            key, lambda: self._optimize_render(renderer, format)
+        )
+        if result.data is None:
+            logger.warning(f"Renderer '{renderer.name}' failed, falling back to APIFlash")
             return None
+        return replace(result, shared=shared)
+
+    async def get_screenshot_result(self, format: str = 'png', force_refresh: bool = False,
+                                    version_time: Optional[datetime] = None,
+                                    priority: Priority = Priority.INTERACTIVE,
+                                    on_queued: Optional[QueueCallback] = None,
+                                    renderer: Optional[str] = None) -> ScreenshotResult:
+        """Получение скриншота с объединением одновременных одинаковых запросов
+
+        Args:
+            format: Формат изображения
+            force_refresh: Не использовать кэш и отрендерить заново
+            version_time: Момент, для которого готовится кэш (для предварительного прогрева)
+            priority: Класс приоритета запроса к APIFlash
+            on_queued: Вызывается с (позиция, оценка ожидания), если запрос ждёт в очереди
+            renderer: Имя альтернативного источника изображения (по умолчанию APIFlash)
+        """
+        if format not in self.formats:
+            logger.error(f"Error in screenshot service: Unsupported format: {format}")
+            return ScreenshotResult(data=None, format=format)
+
+        if renderer and renderer != self.name:
+            if renderer not in self.renderers:
+                logger.error(f"Error in screenshot service: Unknown renderer: {renderer}")
+                return ScreenshotResult(data=None, format=format)
+            result = await self._render_with(self.renderers[renderer], format)
+            if result is not None:
+                return result
+
+        fingerprint = await self._current_fingerprint()
+        params = self._cache_params(format, fingerprint, version_time)
+        factory = self._render_factory(format, params, version_time, priority, on_queued)
+        refresh_factory = self._render_factory(format, params, version_time, self._refresh_priority(priority))
+        return await self._resolve(format, params, factory, force_refresh, refresh_factory=refresh_factory)
+
+    @staticmethod
+    def _refresh_priority(priority: Priority) -> Priority:
+        """Приоритет фонового обновления устаревшей копии: ответ уже отдан, пользователь не ждёт"""
+        return max(priority, Priority.AUTO_REPORT)
+
+    async def _resolve(self, format: str, params: Dict[str, Any],
+                       factory: Callable[[], Awaitable[ScreenshotResult]],
+                       force_refresh: bool = False, allow_fallback: bool = True,
+                       refresh_factory: Optional[Callable[[], Awaitable[ScreenshotResult]]] = None) -> ScreenshotResult:
+        """Ответ из кэша (с фоновым обновлением устаревшей копии) или объединённый рендер
+
+        Args:
+            refresh_factory: Операция фонового обновления (фоновый приоритет, без уведомлений об очереди)
+        """
+        key = self._request_key(params)
+
+        if self.cache_manager is not None and not force_refresh:
+            lookup = await self.cache_manager.alookup(params, format)
+            if lookup.data is not None:
+                if lookup.status == CACHE_STALE:
+                    # Отдаём устаревшую копию сразу, обновление - одно на ключ, в фоне
+                    _, refreshing = self._start_flight(key, refresh_factory or factory)
+                    if not refreshing:
+                        logger.info(f"Started background refresh for stale {format} screenshot")
+                logger.info(f"Screenshot served from {lookup.tier} cache ({format}, {lookup.status})")
+                return ScreenshotResult(
+                    data=lookup.data,
+                    format=format,
+                    cache_tier=lookup.tier,
+                    cache_status=lookup.status
+                )
+
+        result, shared = await self._single_flight(key, factory)
+
+        if result.data is None and allow_fallback:
+            fallback = await self._fallback(format)
+            if fallback is not None:
+                fallback.shared = shared
+                return fallback
+
+        if shared:
+            logger.info(f"Joined in-flight screenshot request for format: {format}")
+        # Результат общий для всех присоединившихся: каждому - своя копия с флагом shared
+        return replace(result, shared=shared)
+
+    async def get_region_result(self, region: str, format: str = 'png',
+                                force_refresh: bool = False,
+                                priority: Priority = Priority.INTERACTIVE,
+                                on_queued: Optional[QueueCallback] = None) -> ScreenshotResult:
+        """Получение именованной области дашборда, вырезанной из мастер-копии
+
+        Args:
+            region: Имя области из SCREENSHOT_REGIONS
+            format: Формат изображения
+            force_refresh: Не использовать кэш области
+            priority: Класс приоритета запроса к APIFlash, если мастер-копии нет в кэше
+            on_queued: Вызывается с (позиция, оценка ожидания), если запрос ждёт в очереди
+        """
+        region = region.lower()
+        if format not in self.formats or region not in self.regions:
+            logger.error(f"Error in screenshot service: Unsupported region/format: {region}/{format}")
+            return ScreenshotResult(data=None, format=format)
+
+        fingerprint = await self._current_fingerprint()
+        params = self._cache_params(format, fingerprint)
+        # Область версионируется вместе с мастер-копией того же периода
+        params['source_format'] = self.master_format
+        params['region'] = region
+        params['box'] = ','.join(str(v) for v in self.regions[region])
+
+        factory = lambda: self._crop_and_cache(region, format, params, priority=priority, on_queued=on_queued)
+        refresh_factory = lambda: self._crop_and_cache(
+            region, format, params, priority=self._refresh_priority(priority)
+        )
+        return await self._resolve(
+            format, params, factory, force_refresh, allow_fallback=False, refresh_factory=refresh_factory
+        )
+
+    async def get_screenshot(self, format: str = 'png') -> Optional[bytes]:
+        """Асинхронное получение скриншота"""
+        result = await self.get_screenshot_result(format)
+        return result.data
+
+    async def render(self, format: str) -> Optional[bytes]:
+        return await self.get_screenshot(format)
 
     @staticmethod
     def get_format_options():
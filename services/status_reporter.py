@@ -4,6 +4,7 @@ import psutil
 from utils.logger import logger
 from services.bot_metrics import BotMetrics
 from services.error_handler import ErrorHandler
+from services.image_enhancer import PRESETS
 
 class StatusReporter:
     def __init__(self, bot_metrics: BotMetrics, error_handler: ErrorHandler):
@@ -38,6 +39,20 @@ class StatusReporter:
             logger.error(f"Error getting system resources: {e}")
             return {'cpu_percent': 0, 'memory_percent': 0, 'memory_available_mb': 0}
 
+    def format_enhancement_stats(self) -> str:
+        """Время улучшения изображений по пресетам"""
+        stats = self.bot_metrics.get_command_stats("enhance:")
+        if not stats:
+            return "• Нет данных"
+        lines = []
+        for name, preset_stats in sorted(stats.items()):
+            title = PRESETS[name].title if name in PRESETS else "Пользовательский"
+            lines.append(
+                f"• {title}: {preset_stats['count']} шт., "
+                f"среднее {preset_stats['average_time']}с, p95 {preset_stats['p95_time']}с"
+            )
+        return "\n".join(lines)
+
     def format_status_message(self) -> str:
         """Форматирует сообщение о статусе бота"""
         try:
@@ -59,6 +74,9 @@ class StatusReporter:
 • Успешность команд: {performance_stats['commands']['success_rate']}%
 • Всего команд: {performance_stats['commands']['total_executed']}
 
+*Улучшение изображений:*
+{self.format_enhancement_stats()}
+
 *Системные ресурсы:*
 • CPU: {system_resources['cpu_percent']}%
 • Память: {system_resources['memory_percent']}%
@@ -91,6 +109,7 @@ _Последнее обновление: {datetime.now().strftime('%Y-%m-%d %H:
             return {
                 'uptime': self.get_uptime(),
                 'performance': performance_stats,
+                'enhancement': self.bot_metrics.get_command_stats("enhance:"),
                 'errors': error_stats,
                 'system': system_resources,
                 'timestamp': datetime.now().isoformat()
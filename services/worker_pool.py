@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class PoolSaturatedError(Exception):
+    """Очередь пула заполнена, задача отклонена"""
+
+class WorkerPool:
+    """Пул потоков для CPU-тяжёлой обработки изображений вне event loop.
+
+    OpenCV освобождает GIL во время кодирования и фильтрации,
+    поэтому потоков достаточно для параллельной работы на нескольких ядрах.
+    Если max_queue задан, задачи сверх max_workers + max_queue отклоняются
+    с PoolSaturatedError, а не накапливаются без ограничения.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, name: str = "image-worker",
+                 max_queue: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.name = name
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Метрики: задачи в работе и в очереди, отказы, время ожидания потока
+        self._pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.max_wait = 0.0
+        self._waits: Deque[float] = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Ленивое создание пула"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=self.name
+            )
+            logger.info(f"Worker pool '{self.name}' started with {self.max_workers} workers")
+        return self._executor
+
+    @property
+    def queued(self) -> int:
+        """Число задач, ожидающих свободного потока"""
+        return max(self._pending - self.max_workers, 0)
+
+    def _record_wait(self, seconds: float):
+        with self._lock:
+            self._waits.append(seconds)
+            self.max_wait = max(self.max_wait, seconds)
+        if seconds > 1:
+            logger.warning(f"Task waited {seconds:.1f}s for a worker in pool '{self.name}'")
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Выполняет функцию в пуле и ожидает результат
+
+        Raises:
+            PoolSaturatedError: очередь пула заполнена
+        """
+        if self.max_queue is not None and self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Worker pool '{self.name}' is saturated, rejecting task")
+            raise PoolSaturatedError(f"Worker pool '{self.name}' queue is full")
+
+        submitted_at = time.monotonic()
+
+        def task():
+            self._record_wait(time.monotonic() - submitted_at)
+            return func(*args)
+
+        with self._lock:
+            self._pending += 1
+        self.submitted += 1
+        try:
+            future = self._get_executor().submit(task)
+        except BaseException:
+            self._task_done()
+            raise
+        # Задача остаётся в пуле и после отмены ожидающей корутины,
+        # поэтому счётчик уменьшается по завершении самой задачи
+        future.add_done_callback(self._task_done)
+        return await asyncio.wrap_future(future)
+
+    def _task_done(self, future: Optional[Future] = None):
+        with self._lock:
+            self._pending -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика пула"""
+        with self._lock:
+            waits = list(self._waits)
+        return {
+            "workers": self.max_workers,
+            "running": min(self._pending, self.max_workers),
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "avg_wait": round(sum(waits) / len(waits), 3) if waits else 0,
+            "max_wait": round(self.max_wait, 3)
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Остановка пула"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+            logger.info(f"Worker pool '{self.name}' stopped")
+
+_image_pool: Optional[WorkerPool] = None
+
+def get_image_pool() -> WorkerPool:
+    """Общий пул обработки изображений для всех обработчиков бота"""
+    global _image_pool
+    if _image_pool is None:
+        from config import IMAGE_WORKERS, IMAGE_QUEUE_DEPTH
+        _image_pool = WorkerPool(
+            max_workers=IMAGE_WORKERS or None,
+            name="image",
+            max_queue=IMAGE_QUEUE_DEPTH
+        )
+    return _image_pool
@@ -0,0 +1,152 @@
+"""Повторы, размыкатель цепи, дублирующие запросы и резервная копия против имитатора APIFlash"""
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+os.environ.setdefault("TELEGRAM_TOKEN", "test")
+os.environ.setdefault("APIFLASH_KEY", "test")
+os.environ.setdefault("SPREADSHEET_URL", "https://docs.google.com/spreadsheets/d/test/edit")
+
+from aiohttp.test_utils import TestServer
+
+from services.apiflash_scheduler import ApiFlashScheduler
+from services.cache_manager import CacheManager, CACHE_STALE
+from services.resilience import CircuitBreaker
+from services.screenshot_service import ScreenshotService
+from tools.fake_apiflash import build_image, create_app
+
+class ApiFlashResilienceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = None
+        self.service = None
+        self.cache_manager = None
+
+    async def asyncTearDown(self):
+        if self.service is not None:
+            await self.service.close()
+        if self.server is not None:
+            await self.server.close()
+        if self.cache_manager is not None:
+            self.cache_manager.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    async def start(self, latency: float = 0, error_rate: float = 0, script=(), max_concurrency: int = 3,
+                    cache: bool = False) -> ScreenshotService:
+        """Имитатор APIFlash и сервис, настроенный на него"""
+        self.app = create_app(latency, 0, error_rate, 503, script)
+        self.server = TestServer(self.app)
+        await self.server.start_server()
+
+        if cache:
+            self.cache_manager = CacheManager(cache_dir=os.path.join(self.tmp_dir, "cache"), io_workers=1)
+        scheduler = ApiFlashScheduler(
+            max_concurrency=max_concurrency, rate_per_minute=600, burst=20,
+            quota_file=os.path.join(self.tmp_dir, "quota.json")
+        )
+        self.service = ScreenshotService(
+            api_url=str(self.server.make_url('/v1/urltoimage')),
+            scheduler=scheduler,
+            cache_manager=self.cache_manager,
+            transcode_locally=True
+        )
+        self.service._default_params.update(width='200', height='100')
+        self.service.retries = 2
+        self.service.backoff_base = 0.01
+        self.service.backoff_max = 0.01
+        self.service.hedge_enabled = False
+        await self.service.start()
+        return self.service
+
+    @property
+    def requests(self) -> int:
+        return self.app['requests']
+
+    async def test_transient_errors_are_retried(self):
+        service = await self.start(script=(503, 503))
+        data = await service._fetch('png')
+        self.assertIsNotNone(data)
+        self.assertEqual(self.requests, 3)
+        self.assertEqual(service.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_client_error_is_not_retried(self):
+        service = await self.start(script=(400,))
+        self.assertIsNone(await service._fetch('png'))
+        self.assertEqual(self.requests, 1)
+
+    async def test_breaker_recovers_after_non_retriable_probe(self):
+        service = await self.start(script=(503, 400))
+        service.retries = 0
+        service.breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0, name="test")
+
+        self.assertIsNone(await service._fetch('png'))
+        self.assertEqual(service.breaker.state, CircuitBreaker.OPEN)
+        # Пробный запрос получает 400: сервис доступен, цепь не остаётся полуоткрытой
+        self.assertIsNone(await service._fetch('png'))
+        self.assertEqual(service.breaker.state, CircuitBreaker.CLOSED)
+        self.assertIsNotNone(await service._fetch('png'))
+
+    async def test_breaker_probe_released_when_quota_exhausted(self):
+        service = await self.start()
+        service.breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0, name="test")
+        service.breaker.record_failure()
+        service.scheduler.monthly_quota = 1
+        service.scheduler.quota_used = 1
+
+        self.assertIsNone(await service._fetch('png'))
+        self.assertEqual(self.requests, 0)
+
+        # Квота снова доступна: следующий вызов может стать пробным запросом
+        service.scheduler.monthly_quota = 0
+        self.assertIsNotNone(await service._fetch('png'))
+        self.assertEqual(service.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_hedge_timer_excludes_scheduler_queue(self):
+        service = await self.start(latency=0.3, max_concurrency=1)
+        service.hedge_enabled = True
+        for _ in range(service.latency.min_samples):
+            service.latency.record(0.5)
+
+        # Второй запрос ждёт слот 0.3 с и выполняется 0.3 с: дольше p95 с момента вызова,
+        # но не с момента получения слота, поэтому дублирующих запросов быть не должно
+        results = await asyncio.gather(service._attempt_hedged('png'), service._attempt_hedged('png'))
+        self.assertTrue(all(results))
+        self.assertEqual(self.requests, 2)
+
+    async def test_fallback_master_is_not_cached_as_derived(self):
+        service = await self.start(error_rate=1.0, cache=True)
+        service.retries = 0
+        old_params = service._cache_params('png', version_time=datetime(2000, 1, 1))
+        self.cache_manager.cache_screenshot(old_params, 'png', build_image(200, 100, 'png'))
+
+        for _ in range(2):
+            result = await service.get_screenshot_result('jpeg')
+            self.assertIsNotNone(result.data)
+            self.assertTrue(result.fallback)
+            self.assertEqual(result.cache_status, CACHE_STALE)
+
+        # Ни перекодированная копия, ни вырезанная область не сохранены как актуальные
+        service.regions['top'] = (0, 0, 100, 50)
+        for _ in range(2):
+            result = await service.get_region_result('top', 'jpeg')
+            self.assertTrue(result.fallback)
+        self.assertEqual(self.cache_manager.get_stats()['cache_entries'], 1)
+
+    async def test_decoded_master_is_released_after_ttl(self):
+        service = await self.start(cache=True)
+        service.decoded_master_ttl = 0.05
+        service.regions.update(top=(0, 0, 100, 50), bottom=(0, 50, 100, 50))
+
+        for region in ('top', 'bottom'):
+            self.assertIsNotNone((await service.get_region_result(region, 'png')).data)
+        self.assertIsNotNone(service._decoded_master)
+        self.assertEqual(self.requests, 1)
+
+        await asyncio.sleep(0.1)
+        self.assertIsNone(service._decoded_master)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Совпадение обработки полосами с обработкой целиком"""
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("TELEGRAM_TOKEN", "test")
+os.environ.setdefault("APIFLASH_KEY", "test")
+os.environ.setdefault("SPREADSHEET_URL", "https://docs.google.com/spreadsheets/d/test/edit")
+
+import cv2
+import numpy as np
+
+from services.image_enhancer import PRESETS, EnhancementPipeline, EnhancementPreset
+
+# Размеры не кратны сетке плиток CLAHE: проверяется и дополнение при расчёте гистограмм
+SIZES = [(4001, 1001), (1999, 1283), (3001, 777)]
+# ±1 уровень L после CLAHE даёт в BGR до стольких уровней в насыщенных цветах
+CONTRAST_TOLERANCE = 8
+# Доля пикселей, которые вообще могут отличаться
+MAX_DIFFERING_FRACTION = 1e-4
+
+def dashboard_image(height: int, width: int, seed: int) -> np.ndarray:
+    """Плоские цветные блоки с текстом и небольшим шумом, как на скриншоте дашборда"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 245, np.uint8)
+    for _ in range(60):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(image, (x, y), (x + int(rng.integers(20, 400)), y + int(rng.integers(10, 200))), color, -1)
+        cv2.putText(image, "1234 abc", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    noise = rng.integers(-6, 7, image.shape)
+    return np.clip(image.astype(int) + noise, 0, 255).astype(np.uint8)
+
+class StripEnhancementTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ThreadPoolExecutor(max_workers=4)
+        cls.images = [dashboard_image(height, width, seed) for seed, (height, width) in enumerate(SIZES)]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def compare(self, preset: EnhancementPreset, image: np.ndarray) -> np.ndarray:
+        single = EnhancementPipeline(preset).enhance(image)
+        strips = EnhancementPipeline(
+            preset, strip_executor=self.executor, strip_count=8, strip_min_height=1
+        ).enhance(image)
+        return np.abs(single.astype(np.int16) - strips.astype(np.int16))
+
+    def test_contrast_matches_single_pass(self):
+        for clip_limit in (0.6, 1.2, 2.0):
+            # sharpness 1 - единичное ядро, сравнивается только CLAHE
+            preset = EnhancementPreset('contrast', clip_limit, 1.0)
+            for image in self.images:
+                with self.subTest(clip_limit=clip_limit, size=image.shape[:2]):
+                    diff = self.compare(preset, image)
+                    self.assertLessEqual(int(diff.max()), CONTRAST_TOLERANCE)
+                    self.assertLessEqual(float((diff > 0).mean()), MAX_DIFFERING_FRACTION)
+
+    def test_presets_match_single_pass(self):
+        for name, preset in PRESETS.items():
+            # Фильтр резкости с суммой модулей коэффициентов 2 * sharpness - 1 усиливает отличия CLAHE
+            bound = CONTRAST_TOLERANCE * (2 * preset.sharpness - 1)
+            for image in self.images:
+                with self.subTest(preset=name, size=image.shape[:2]):
+                    diff = self.compare(preset, image)
+                    self.assertLessEqual(int(diff.max()), bound)
+                    self.assertLessEqual(float((diff > 0).mean()), MAX_DIFFERING_FRACTION)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""Обнаружение мелких изменений дашборда при сравнении с последним отправленным скриншотом"""
+import unittest
+
+import cv2
+import numpy as np
+
+from services.image_codec import encode
+from services.image_diff import DiffTracker
+from services.worker_pool import WorkerPool
+
+WIDTH, HEIGHT = 2440, 2000
+
+def render_dashboard(values, color: int = 0, background: int = 255, fmt: str = 'png') -> bytes:
+    """Таблица чисел мелким шрифтом, как ячейки дашборда"""
+    image = np.full((HEIGHT, WIDTH, 3), background, np.uint8)
+    for index, value in enumerate(values):
+        x, y = 40 + (index % 10) * 240, 40 + (index // 10) * 30
+        cv2.putText(image, value, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (color, color, color), 1, cv2.LINE_AA)
+    return encode(image, fmt)
+
+class DiffTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(1, name="diff-test")
+        self.tracker = DiffTracker(self.pool)
+        self.values = [f"{i * 37 % 1000:>4}" for i in range(600)]
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def baseline(self, data: bytes):
+        return self.tracker.compare(None, data).signature
+
+    def test_identical_image_is_unchanged(self):
+        data = render_dashboard(self.values)
+        result = self.tracker.compare(self.baseline(data), render_dashboard(self.values))
+        self.assertFalse(result.changed)
+
+    def test_one_digit_change_is_detected(self):
+        # Чёрный и серый текст: на уменьшенной копии такие правки сглаживаются ниже порога
+        for color in (0, 96):
+            previous = self.baseline(render_dashboard(self.values, color))
+            for index, old, new in ((0, '0', '1'), (42, '4', '1'), (10, '3', '8')):
+                changed = list(self.values)
+                changed[index] = changed[index][::-1].replace(old, new, 1)[::-1]
+                with self.subTest(color=color, was=self.values[index], now=changed[index]):
+                    result = self.tracker.compare(previous, render_dashboard(changed, color))
+                    self.assertTrue(result.changed)
+                    x, y, w, h = result.box
+                    cell_x, cell_y = 40 + (index % 10) * 240, 40 + (index // 10) * 30
+                    # Рамка охватывает только изменившуюся ячейку
+                    self.assertTrue(cell_x <= x and x + w <= cell_x + 60)
+                    self.assertTrue(cell_y - 15 <= y and y + h <= cell_y + 5)
+
+    def test_one_digit_change_in_jpeg_is_detected(self):
+        previous = self.baseline(render_dashboard(self.values, fmt='jpeg'))
+        changed = list(self.values)
+        changed[42] = changed[42][:-1] + '1'
+        result = self.tracker.compare(previous, render_dashboard(changed, fmt='jpeg'))
+        self.assertTrue(result.changed)
+
+    def test_smooth_global_change_is_detected_by_phash(self):
+        previous = self.baseline(render_dashboard(self.values))
+        image = cv2.imdecode(np.frombuffer(render_dashboard(self.values), np.uint8), cv2.IMREAD_COLOR)
+        # Яркость плавно падает слева направо: ни один пиксель не отличается больше чем на порог
+        shade = np.linspace(0, self.tracker.threshold, WIDTH).astype(np.uint8)
+        image = cv2.subtract(image, np.broadcast_to(shade[None, :, None], image.shape).copy())
+        result = self.tracker.compare(previous, encode(image, 'png'))
+        self.assertTrue(result.changed)
+        self.assertGreaterEqual(result.distance, self.tracker.phash_distance)
+        self.assertEqual(result.box, (0, 0, WIDTH, HEIGHT))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Локальный имитатор APIFlash для проверки устойчивости сервиса скриншотов.
+
+Отдаёт PNG-изображение и по параметрам запуска добавляет задержку и ошибки.
+
+Запуск:
+    python tools/fake_apiflash.py --port 8080 --latency 2 --jitter 3 --error-rate 0.3
+    APIFLASH_URL=http://127.0.0.1:8080/v1/urltoimage python main.py
+
+Автоматические проверки против имитатора:
+    python -m unittest discover -s tests -t .
+"""
+import argparse
+import asyncio
+import logging
+import random
+from typing import Sequence
+
+import cv2
+import numpy as np
+from aiohttp import web
+
+logger = logging.getLogger("fake_apiflash")
+
+def build_image(width: int, height: int, format: str) -> bytes:
+    """Простое изображение-заглушка в нужном формате"""
+    image = np.full((height, width, 3), 255, np.uint8)
+    cv2.putText(image, "fake apiflash", (40, 120), cv2.FONT_HERSHEY_SIMPLEX, 3, (60, 60, 60), 6)
+    extension = {'png': '.png', 'jpeg': '.jpg', 'webp': '.webp'}.get(format, '.png')
+    success, buffer = cv2.imencode(extension, image)
+    if not success:
+        raise ValueError(f"Failed to encode {format}")
+    return buffer.tobytes()
+
+def create_app(latency: float, jitter: float, error_rate: float, error_status: int,
+               script: Sequence[int] = ()) -> web.Application:
+    """Приложение имитатора
+
+    Args:
+        script: Коды ответов на первые запросы по порядку (200 - изображение), далее - по error_rate
+    """
+    async def urltoimage(request: web.Request) -> web.Response:
+        index = app['requests']
+        app['requests'] += 1
+        await asyncio.sleep(latency + random.uniform(0, jitter))
+
+        status = script[index] if index < len(script) else None
+        if status is not None and status != 200:
+            logger.info(f"Scripted error {status}")
+            return web.Response(status=status, text="scripted error")
+        if status is None and random.random() < error_rate:
+            logger.info(f"Injecting error {error_status}")
+            return web.Response(status=error_status, text="injected error")
+
+        format = request.query.get('format', 'png')
+        width = min(int(request.query.get('width', 1280)), 4000)
+        height = min(int(request.query.get('height', 800)), 4000)
+        content_type = 'image/jpeg' if format == 'jpeg' else f'image/{format}'
+        return web.Response(body=build_image(width, height, format), content_type=content_type)
+
+    app = web.Application()
+    app['requests'] = 0  # число полученных запросов
+    app.router.add_get('/v1/urltoimage', urltoimage)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake APIFlash server")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.5, help="базовая задержка, секунды")
+    parser.add_argument('--jitter', type=float, default=0.0, help="случайная добавка к задержке, секунды")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов с ошибкой")
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = create_app(args.latency, args.jitter, args.error_rate, args.error_status)
+    web.run_app(app, host='127.0.0.1', port=args.port)
+
+if __name__ == '__main__':
+    main()